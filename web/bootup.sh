@@ -1,3 +1,8 @@
 #!/usr/bin/env bash
 python manage.py migrate
-python manage.py runserver 0.0.0.0:8000
+if [ "$WEB_SERVER" = "gunicorn" ]; then
+    # exec, so docker's SIGTERM reaches gunicorn and in-flight requests are drained
+    exec gunicorn -c gunicorn.conf.py django_server.wsgi
+fi
+# development: runserver reloads on every change to the mounted code
+exec python manage.py runserver 0.0.0.0:8000
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+from functools import partial
+
+from django.conf import settings
+from graphql import GraphQLCoreBackend
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import validate
+
+from django_server.libs.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def get_query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+def execute_validated(schema, document_ast, errors, *args, **kwargs):
+    if errors:
+        return ExecutionResult(errors=errors, invalid=True)
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    # parses and validates every distinct query once, the documents are shared by all requests
+    def __init__(self, maxsize=None, executor=None):
+        super(CachedDocumentBackend, self).__init__(executor=executor)
+        self.documents = LRUCache(maxsize or settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super(CachedDocumentBackend, self).document_from_string(schema, document_string)
+
+        key = (id(schema), get_query_hash(document_string))
+        document = self.documents.get(key)
+        if document is not None:
+            return document
+
+        # syntax errors raise here and are never cached
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(execute_validated, schema, document_ast, errors, **self.execute_params),
+        )
+        document.validation_errors = errors
+
+        self.documents.set(key, document)
+        return document
+
+
+class PersistedQueries(object):
+    # {operation id: query} manifest shipped with the clients, read on first use
+    def __init__(self, path):
+        self.path = path
+        self._queries = None
+
+    @property
+    def queries(self):
+        if self._queries is None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self._queries = json.load(f)
+            except FileNotFoundError:
+                logger.warning(f"persisted query manifest not found: {self.path}")
+                self._queries = {}
+        return self._queries
+
+    def get(self, operation_id):
+        return self.queries.get(operation_id)
+
+
+document_backend = CachedDocumentBackend()
+persisted_queries = PersistedQueries(settings.GRAPHQL_PERSISTED_QUERIES)
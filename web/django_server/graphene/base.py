@@ -1,8 +1,13 @@
 import graphene
 from graphene_django import DjangoObjectType
+from promise import Promise
 
 from django_server import const
 from django_server import models
+from django_server.graphene.cache import cache_control
+from django_server.graphene.connection import CountableConnection, KeysetConnectionField
+from django_server.graphene.loader import load_related
+from django_server.graphene.optimizer import requires
 
 ManClass = graphene.Enum.from_enum(const.ManClassEnum)
 ProgramState = graphene.Enum.from_enum(const.ProgramStateEnum)
@@ -15,14 +20,19 @@ def is_editable_program(program, user):
     if user.role == const.ManClassEnum.ADMIN.value:
         return True
 
-    return program.owner == user
+    return program.owner_id == user.id
 
 
+@cache_control(max_age=60)
 class Program(DjangoObjectType):
     state = graphene.Field(ProgramState)
     required_man_class = graphene.Field(ManClass)
     is_editable = graphene.Boolean()
     image_url = graphene.String()
+    participant_count = graphene.Int(required=True)
+    seats_left = graphene.Int(required=True)
+    is_full = graphene.Boolean(required=True)
+    meeting = KeysetConnectionField(lambda: Meeting, required=True)
 
     class Meta:
         model = models.Program
@@ -31,7 +41,10 @@ class Program(DjangoObjectType):
             'description': ['exact', 'icontains'],
         }
         interfaces = (graphene.Node,)
-        exclude_fields = ('state', 'required_man_class')
+        connection_class = CountableConnection
+        # the seats_taken counter is internal, clients see participantCount. graphene-django 2 warns once
+        # at import about excluding a model field it has no graphene field for
+        exclude_fields = ('state', 'required_man_class', 'seats_taken')
 
     @staticmethod
     def resolve_state(root, info, **kwargs):
@@ -42,23 +55,91 @@ class Program(DjangoObjectType):
         return root.required_man_class
 
     @staticmethod
+    @cache_control(max_age=0)
+    @requires('owner_id')
     def resolve_is_editable(root, info, **kwargs):
         if not hasattr(info.context, 'user'):
             return False
         return is_editable_program(root, info.context.user)
 
     @staticmethod
+    @requires('image_no')
     def resolve_image_url(root, info, **kwargs):
         return f'img_{root.image_no}.jpg'
 
+    # from the seats_taken counter, no participant rows are read
+    @staticmethod
+    @requires('seats_taken')
+    def resolve_participant_count(root, info, **kwargs):
+        return root.seats_taken
+
+    @staticmethod
+    @requires('seats_taken', 'participants_max')
+    def resolve_seats_left(root, info, **kwargs):
+        return max(root.participants_max - root.seats_taken, 0)
+
+    @staticmethod
+    @requires('seats_taken', 'participants_max')
+    def resolve_is_full(root, info, **kwargs):
+        return root.seats_taken >= root.participants_max
+
+    @staticmethod
+    def resolve_space(root, info, **kwargs):
+        return load_related(root, info, 'space')
 
+    @staticmethod
+    def resolve_owner(root, info, **kwargs):
+        return load_related(root, info, 'owner')
+
+    @staticmethod
+    def resolve_tag(root, info, **kwargs):
+        return load_related(root, info, 'tag')
+
+
+@cache_control(max_age=60)
 class Meeting(DjangoObjectType):
+    participant_count = graphene.Int(required=True)
+    seats_left = graphene.Int(required=True)
+    is_full = graphene.Boolean(required=True)
+
     class Meta:
         model = models.Meeting
         filter_fields = {
             'name': ['exact', 'icontains'],
         }
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
+        exclude_fields = ('seats_taken',)
+
+    @staticmethod
+    @requires('seats_taken')
+    def resolve_participant_count(root, info, **kwargs):
+        return root.seats_taken
+
+    # lists join the program's participants_max, single meetings load it through the program loader
+    @staticmethod
+    @requires('seats_taken', 'program__participants_max')
+    def resolve_seats_left(root, info, **kwargs):
+        return Promise.resolve(load_related(root, info, 'program')) \
+            .then(lambda program: max(program.participants_max - root.seats_taken, 0))
+
+    @staticmethod
+    @requires('seats_taken', 'program__participants_max')
+    def resolve_is_full(root, info, **kwargs):
+        return Promise.resolve(load_related(root, info, 'program')) \
+            .then(lambda program: root.seats_taken >= program.participants_max)
+
+    @staticmethod
+    def resolve_program(root, info, **kwargs):
+        return load_related(root, info, 'program')
+
+    @staticmethod
+    def resolve_space(root, info, **kwargs):
+        return load_related(root, info, 'space')
+
+    @staticmethod
+    def resolve_zoom(root, info, **kwargs):
+        return load_related(root, info, 'zoom')
 
 
 class Error(graphene.ObjectType):
@@ -67,3 +148,8 @@ class Error(graphene.ObjectType):
 
     def __str__(self):
         return f"{self.key} {self.message} {self.field} {self.info}"
+
+
+class IndexedError(graphene.ObjectType):
+    idx = graphene.Int(required=True)
+    error = graphene.Field(Error, required=True)
@@ -0,0 +1,103 @@
+import logging
+
+from graphene.utils.str_converters import to_snake_case
+from graphql.language.ast import FragmentDefinition, FragmentSpread, InlineFragment, OperationDefinition
+from graphql.type import GraphQLObjectType, is_leaf_type
+
+from django_server.graphene.optimizer import is_connection, unwrap
+
+logger = logging.getLogger(__name__)
+
+
+def cache_control(max_age):
+    # cache hint in seconds on a graphene type or a resolver, e.g. @cache_control(max_age=60)
+    def decorator(obj):
+        obj.cache_max_age = max_age
+        return obj
+    return decorator
+
+
+def get_hint(graphql_type, field_name):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    resolver = getattr(graphene_type, f'resolve_{to_snake_case(field_name)}', None)
+    return getattr(resolver, 'cache_max_age', None)
+
+
+def get_type_hint(graphql_type):
+    return getattr(getattr(graphql_type, 'graphene_type', None), 'cache_max_age', None)
+
+
+def get_possible_types(schema, graphql_type):
+    if isinstance(graphql_type, GraphQLObjectType):
+        return [graphql_type]
+    return schema.get_possible_types(graphql_type)
+
+
+def selection_max_age(schema, graphql_type, selection_set, fragments, parent_max_age):
+    # a field takes its own hint, then its type's hint. leaves and connection plumbing inherit
+    # from the parent, any other object field without a hint is not cacheable.
+    max_age = None
+    for selection in selection_set.selections:
+        if isinstance(selection, FragmentSpread):
+            fragment = fragments[selection.name.value]
+            types = [schema.get_type(fragment.type_condition.name.value)]
+            selection_set = fragment.selection_set
+        elif isinstance(selection, InlineFragment):
+            types = [schema.get_type(selection.type_condition.name.value)] if selection.type_condition \
+                else [graphql_type]
+            selection_set = selection.selection_set
+        else:
+            types = None
+
+        if types is not None:
+            for x in types:
+                age = selection_max_age(schema, x, selection_set, fragments, parent_max_age)
+                max_age = age if max_age is None else min(max_age, age)
+            continue
+
+        name = selection.name.value
+        if name.startswith('__'):
+            continue
+
+        for parent_type in get_possible_types(schema, graphql_type):
+            field = parent_type.fields.get(name)
+            if field is None:
+                continue
+
+            field_type = unwrap(field.type)
+            age = get_hint(parent_type, name)
+            if age is None:
+                age = get_type_hint(field_type)
+            if age is None:
+                inherits = is_leaf_type(field_type) or is_connection(field_type) or is_connection(parent_type)
+                age = parent_max_age if inherits else 0
+
+            if selection.selection_set:
+                age = min(age, selection_max_age(schema, field_type, selection.selection_set, fragments, age))
+            max_age = age if max_age is None else min(max_age, age)
+
+    return parent_max_age if max_age is None else max_age
+
+
+def get_max_age(schema, document_ast, operation_name=None):
+    # seconds the response to a query may be shared for, 0 if it must not be cached
+    operations = [x for x in document_ast.definitions if isinstance(x, OperationDefinition)]
+    fragments = {x.name.value: x for x in document_ast.definitions if isinstance(x, FragmentDefinition)}
+
+    for operation in operations:
+        if operation_name and (not operation.name or operation.name.value != operation_name):
+            continue
+        if operation.operation != 'query':
+            return 0
+        # root fields are cacheable only with an explicit hint
+        return selection_max_age(schema, schema.get_query_type(), operation.selection_set, fragments, 0)
+
+    return 0
+
+
+def get_document_max_age(document, operation_name=None):
+    # documents are shared by the cached backend, so is the hint
+    hints = document.__dict__.setdefault('cache_max_age', {})
+    if operation_name not in hints:
+        hints[operation_name] = get_max_age(document.schema, document.document_ast, operation_name)
+    return hints[operation_name]
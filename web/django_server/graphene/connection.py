@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+
+import graphene
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql_relay.utils import base64, unbase64
+
+from django_server.graphene.exception import LogicalException
+
+logger = logging.getLogger(__name__)
+
+CURSOR_PREFIX = 'keyset:'
+ESTIMATED_COUNT_TIMEOUT = 60
+
+
+def estimate_count(queryset):
+    # planner statistics for whole tables, otherwise an exact count shared for a short while
+    if not queryset.query.where:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if row and row[0] >= 0:
+            return int(row[0])
+
+    key = 'count:' + hashlib.md5(str(queryset.query).encode('utf-8')).hexdigest()
+    return cache.get_or_set(key, queryset.count, ESTIMATED_COUNT_TIMEOUT)
+
+
+class CountableConnection(graphene.relay.Connection):
+    total_count = graphene.Int(estimated=graphene.Boolean(default_value=False))
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def resolve_total_count(root, info, estimated=False):
+        queryset = getattr(root, 'queryset', None)
+        if queryset is None:
+            # graphene-django's own connections have already counted
+            return root.length
+
+        if estimated:
+            return estimate_count(queryset)
+        return queryset.count()
+
+
+def get_keyset(model):
+    # the model's Meta.ordering, made unique with the primary key
+    ordering = list(model._meta.ordering)
+    if not any(x.lstrip('-') in ['id', 'pk'] for x in ordering):
+        ordering.append('id')
+    return ordering
+
+
+def reverse_keyset(keyset):
+    return [x[1:] if x.startswith('-') else f'-{x}' for x in keyset]
+
+
+def encode_cursor(keyset, obj):
+    values = [obj._meta.get_field(x.lstrip('-')).value_to_string(obj) for x in keyset]
+    return base64(CURSOR_PREFIX + json.dumps(values))
+
+
+def decode_cursor(keyset, model, cursor):
+    try:
+        values = json.loads(unbase64(cursor)[len(CURSOR_PREFIX):])
+        return [model._meta.get_field(x.lstrip('-')).to_python(v) for x, v in zip(keyset, values)]
+    except Exception:
+        raise LogicalException(f"invalid cursor: {cursor}")
+
+
+def seek(keyset, values):
+    # rows strictly after `values` in keyset order: (a > x) OR (a = x AND b > y) OR ...
+    condition = Q()
+    for i, key in enumerate(keyset):
+        name = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for prev_key, prev_value in zip(keyset[:i], values[:i]):
+            step &= Q(**{prev_key.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    # seeks with opaque (ordering..., id) cursors instead of OFFSET and never counts the table
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable):
+        queryset = maybe_queryset(iterable)
+        keyset = get_keyset(queryset.model)
+        first = args.get('first')
+        last = args.get('last')
+        after = args.get('after')
+        before = args.get('before')
+
+        queryset = queryset.order_by(*keyset)
+        # counted only if totalCount is selected
+        total = queryset
+        if after:
+            queryset = queryset.filter(seek(keyset, decode_cursor(keyset, queryset.model, after)))
+        if before:
+            queryset = queryset.filter(seek(reverse_keyset(keyset), decode_cursor(keyset, queryset.model, before)))
+
+        has_next_page = False
+        has_previous_page = False
+        if first is not None:
+            rows = list(queryset[:first + 1])
+            has_next_page = len(rows) > first
+            rows = rows[:first]
+            if last is not None and len(rows) > last:
+                rows = rows[-last:] if last else []
+                has_previous_page = True
+        elif last is not None:
+            rows = list(queryset.order_by(*reverse_keyset(keyset))[:last + 1])
+            has_previous_page = len(rows) > last
+            rows = rows[:last][::-1]
+        else:
+            rows = list(queryset)
+
+        edges = [connection.Edge(node=row, cursor=encode_cursor(keyset, row)) for row in rows]
+        page_info = PageInfo(start_cursor=edges[0].cursor if edges else None,
+                             end_cursor=edges[-1].cursor if edges else None,
+                             has_previous_page=has_previous_page,
+                             has_next_page=has_next_page)
+
+        connection = connection(edges=edges, page_info=page_info)
+        connection.iterable = rows
+        connection.queryset = total
+        return connection
@@ -0,0 +1,108 @@
+import logging
+
+from django.conf import settings
+from graphene.utils.str_converters import to_snake_case
+from graphql import GraphQLError, GraphQLInt
+from graphql.language.ast import OperationDefinition
+from graphql.type import GraphQLList, GraphQLNonNull, is_leaf_type
+from graphql.utils.value_from_ast import value_from_ast
+
+from django_server.graphene.optimizer import get_field_asts, is_connection, unwrap
+
+logger = logging.getLogger(__name__)
+
+
+def query_cost(cost):
+    # cost of a resolver on top of its selection, e.g. @query_cost(1) on a field running its own query
+    def decorator(func):
+        func.query_cost = cost
+        return func
+    return decorator
+
+
+class QueryCost(object):
+    def __init__(self, cost=0, depth=0):
+        self.cost = cost
+        self.depth = depth
+
+    def to_dict(self):
+        return {'cost': self.cost, 'depth': self.depth}
+
+
+def is_list(graphql_type):
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+def get_multiplier(field_ast, variables):
+    # rows a list or connection may return: first/last, or the default page size when unbounded
+    sizes = [value_from_ast(x.value, GraphQLInt, variables)
+             for x in field_ast.arguments if x.name.value in ['first', 'last']]
+    sizes = [x for x in sizes if isinstance(x, int)]
+    return min(sizes) if sizes else settings.GRAPHQL_DEFAULT_PAGE_SIZE
+
+
+def selection_cost(graphql_type, selection_set, fragments, variables, depth, plumbing=False):
+    # object fields cost 1 and leaves 0, times the rows of every list or connection above them.
+    # edges, node and pageInfo of a connection are plumbing: they add neither cost nor depth.
+    result = QueryCost(depth=depth)
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+
+    for field_ast in get_field_asts(selection_set, fragments):
+        field = graphql_type.fields.get(field_ast.name.value)
+        if field is None:
+            continue
+
+        field_type = unwrap(field.type)
+        field_depth = depth if plumbing else depth + 1
+        resolver = getattr(graphene_type, f'resolve_{to_snake_case(field_ast.name.value)}', None)
+        cost = getattr(resolver, 'query_cost', None)
+        if cost is None:
+            cost = 0 if plumbing or is_leaf_type(field_type) else 1
+
+        child = QueryCost(depth=field_depth)
+        if field_ast.selection_set:
+            child = selection_cost(field_type, field_ast.selection_set, fragments, variables, field_depth,
+                                   plumbing=is_connection(field_type) or is_connection(graphql_type))
+
+        multiplier = 1
+        if is_connection(field_type) or (is_list(field.type) and not is_connection(graphql_type)):
+            multiplier = get_multiplier(field_ast, variables)
+
+        result.cost += cost + multiplier * child.cost
+        result.depth = max(result.depth, child.depth)
+
+    return result
+
+
+def get_variables(operation, variables):
+    values = {x.variable.name.value: value_from_ast(x.default_value, GraphQLInt)
+              for x in operation.variable_definitions or [] if x.default_value}
+    values.update(variables or {})
+    return values
+
+
+def get_query_cost(schema, document_ast, operation_name=None, variables=None):
+    operations = [x for x in document_ast.definitions if isinstance(x, OperationDefinition)]
+    fragments = {x.name.value: x for x in document_ast.definitions if x not in operations}
+
+    for operation in operations:
+        if operation_name and (not operation.name or operation.name.value != operation_name):
+            continue
+
+        root_type = schema.get_mutation_type() if operation.operation == 'mutation' else schema.get_query_type()
+        return selection_cost(root_type, operation.selection_set, fragments, get_variables(operation, variables), 0)
+
+    return QueryCost()
+
+
+def check_query_cost(cost, role, spent=0):
+    # GraphQLError when the query is over the depth or cost budget of the role.
+    # `spent` is the cost of the earlier operations of a batch, which share one budget
+    max_depth, max_cost = settings.GRAPHQL_QUERY_LIMITS.get(role, settings.GRAPHQL_QUERY_LIMITS[None])
+    if cost.depth > max_depth:
+        return GraphQLError(f"query is too deep: {cost.depth} > {max_depth}")
+    if spent + cost.cost > max_cost:
+        return GraphQLError(f"query is too expensive: {spent + cost.cost} > {max_cost}")
+    return None
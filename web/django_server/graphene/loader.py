@@ -0,0 +1,78 @@
+import logging
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+logger = logging.getLogger(__name__)
+
+
+def get_identity_map(context):
+    # {(model, pk): object or None} of the request, so every row is fetched at most once
+    identity_map = getattr(context, 'identity_map', None)
+    if identity_map is None:
+        identity_map = {}
+        setattr(context, 'identity_map', identity_map)
+    return identity_map
+
+
+def get_objects(context, model, pks):
+    identity_map = get_identity_map(context)
+    missing = {pk for pk in pks if (model, pk) not in identity_map}
+    if missing:
+        objects = model.objects.in_bulk(missing)
+        for pk in missing:
+            identity_map[(model, pk)] = objects.get(pk)
+
+    return {pk: identity_map[(model, pk)] for pk in pks if identity_map[(model, pk)] is not None}
+
+
+def get_object(context, model, pk):
+    if pk is None:
+        return None
+    return get_objects(context, model, [pk]).get(pk)
+
+
+def remember(context, obj):
+    get_identity_map(context)[(type(obj), obj.pk)] = obj
+    return obj
+
+
+def clear(context):
+    # rows may have changed, e.g. after a mutation in a batch
+    setattr(context, 'identity_map', {})
+    setattr(context, 'loaders', {})
+
+
+class ModelLoader(DataLoader):
+    def __init__(self, model, context):
+        super(ModelLoader, self).__init__()
+        self.model = model
+        self.context = context
+
+    def batch_load_fn(self, keys):
+        objects = get_objects(self.context, self.model, keys)
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+def get_loader(info, model):
+    # one loader per model and per request; the GraphQL context lives exactly as long as the request
+    loaders = getattr(info.context, 'loaders', None)
+    if loaders is None:
+        loaders = {}
+        setattr(info.context, 'loaders', loaders)
+
+    if model not in loaders:
+        loaders[model] = ModelLoader(model, info.context)
+    return loaders[model]
+
+
+def load_related(root, info, name):
+    field = root._meta.get_field(name)
+    if field.is_cached(root):
+        return getattr(root, name)
+
+    pk = getattr(root, field.attname)
+    if pk is None:
+        return None
+
+    return get_loader(info, field.related_model).load(pk)
@@ -0,0 +1,128 @@
+import logging
+
+import graphene
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language.ast import FragmentSpread, InlineFragment
+
+from django_server.graphene.connection import get_keyset
+
+logger = logging.getLogger(__name__)
+
+
+def requires(*lookups):
+    # declares the model fields a custom resolver reads from its root, e.g. @requires('owner_id')
+    def decorator(func):
+        func.requires = lookups
+        return func
+    return decorator
+
+
+class QueryPlan(object):
+    def __init__(self):
+        self.only = set()
+        self.select_related = set()
+        self.prefetch_related = []
+
+    def add(self, lookup):
+        parts = lookup.split('__')
+        for i in range(1, len(parts)):
+            self.select_related.add('__'.join(parts[:i]))
+            self.only.add('__'.join(parts[:i]))
+        self.only.add(lookup)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset.only(*self.only)
+
+
+def unwrap(graphql_type):
+    while hasattr(graphql_type, 'of_type'):
+        graphql_type = graphql_type.of_type
+    return graphql_type
+
+
+def is_connection(graphql_type):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, graphene.relay.Connection)
+
+
+def get_field_asts(selection_set, fragments):
+    if not selection_set:
+        return
+
+    for selection in selection_set.selections:
+        if isinstance(selection, FragmentSpread):
+            yield from get_field_asts(fragments[selection.name.value].selection_set, fragments)
+        elif isinstance(selection, InlineFragment):
+            yield from get_field_asts(selection.selection_set, fragments)
+        else:
+            yield selection
+
+
+def get_nodes(graphql_type, selection_set, fragments):
+    # (node type, node selection set) of a connection or of a plain object/list field
+    if not is_connection(graphql_type):
+        yield graphql_type, selection_set
+        return
+
+    edge_type = unwrap(graphql_type.fields['edges'].type)
+    for edges in get_field_asts(selection_set, fragments):
+        if edges.name.value != 'edges':
+            continue
+        for node in get_field_asts(edges.selection_set, fragments):
+            if node.name.value == 'node':
+                yield unwrap(edge_type.fields['node'].type), node.selection_set
+
+
+def collect(plan, model, graphql_type, selection_set, fragments, prefix=''):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+
+    for field_ast in get_field_asts(selection_set, fragments):
+        graphql_field = graphql_type.fields.get(field_ast.name.value)
+        if graphql_field is None:
+            continue
+
+        name = to_snake_case(field_ast.name.value)
+        resolver = getattr(graphene_type, f'resolve_{name}', None)
+        for lookup in getattr(resolver, 'requires', ()):
+            plan.add(prefix + lookup)
+
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+
+        field_type = unwrap(graphql_field.type)
+        if not field.is_relation:
+            plan.add(prefix + name)
+        elif field.concrete and (field.many_to_one or field.one_to_one):
+            plan.add(prefix + name)
+            plan.select_related.add(prefix + name)
+            collect(plan, field.related_model, field_type, field_ast.selection_set, fragments, f'{prefix}{name}__')
+        elif field.one_to_many and not is_connection(field_type):
+            # connection fields re-filter their queryset and cannot reuse a prefetch
+            related = QueryPlan()
+            related.add(field.field.attname)
+            collect(related, field.related_model, field_type, field_ast.selection_set, fragments)
+            queryset = related.apply(field.related_model._default_manager.all())
+            plan.prefetch_related.append(Prefetch(prefix + name, queryset=queryset))
+
+
+def optimize(queryset, info):
+    # narrows the queryset of a list, connection or node resolver to the selection of the current field
+    plan = QueryPlan()
+    if is_connection(unwrap(info.return_type)):
+        # keyset cursors are built from the ordering columns
+        for key in get_keyset(queryset.model):
+            plan.add(key.lstrip('-'))
+
+    for field_ast in info.field_asts:
+        for node_type, selection_set in get_nodes(unwrap(info.return_type), field_ast.selection_set, info.fragments):
+            collect(plan, queryset.model, node_type, selection_set, info.fragments)
+
+    return plan.apply(queryset)
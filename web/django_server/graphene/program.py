@@ -3,62 +3,42 @@ import datetime
 import logging
 
 import graphene
+from django.conf import settings
+from django.db import transaction
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 
 from django_server import const
 from django_server import models
-from django_server.graphene.base import (ManClass, ProgramState, Error, ProgramTagType,
+from django_server.graphene.base import (ManClass, ProgramState, Error, IndexedError, ProgramTagType,
                                          Program, Meeting, is_editable_program)
-from django_server.graphene.utils import get_object_from_global_id, has_program, assign, has_meeting
+from django_server.graphene.cache import cache_control
+from django_server.graphene.connection import CountableConnection, KeysetConnectionField
+from django_server.graphene.loader import load_related
+from django_server.graphene.optimizer import optimize
+from django_server.graphene.utils import (get_object_from_global_id, get_objects_from_global_ids,
+                                          get_pk_from_global_id, has_program, assign, has_meeting)
+from django_server.libs.attendance import attendance, get_seats
 from django_server.libs.authentification import authorization
+from django_server.libs.conflict import Reservation, bulk_save_meetings, find_conflicts, save_meeting
+from django_server.libs.snapshot import TableSnapshot
 
 logger = logging.getLogger(__name__)
 
+# the tags are rarely changed and the same for every request
+program_tags = TableSnapshot(models.ProgramTag.objects.filter(is_active=True), max_age=300)
 
-def is_duplicated_space(space, start_time, end_time, meeting=None):
-    meetings = models.Meeting.objects.all()
-    if meeting:
-        meetings = meetings.exclude(id=meeting.id)
 
-    if meetings.filter(space=space, start_time__lte=start_time, end_time__gt=start_time).count() > 0:
-        return True
-    if meetings.filter(space=space, start_time__lt=end_time, end_time__gte=end_time).count() > 0:
-        return True
-    return False
+def get_conflicts(lst):
+    reservations = [Reservation(idx=i,
+                                meeting_id=get_pk_from_global_id(getattr(argument, 'id', None)),
+                                space_id=get_pk_from_global_id(argument.space_id),
+                                zoom_id=get_pk_from_global_id(argument.zoom_id),
+                                start_time=argument.start_time,
+                                end_time=argument.end_time) for i, argument in enumerate(lst)]
 
-
-def is_duplicated_zoom(zoom, start_time, end_time, meeting=None):
-    meetings = models.Meeting.objects.all()
-    if meeting:
-        meetings = meetings.exclude(id=meeting.id)
-
-    if meetings.filter(zoom=zoom, start_time__lte=start_time, end_time__gt=start_time).count() > 0:
-        return True
-    if meetings.filter(zoom=zoom, start_time__lt=end_time, end_time__gte=end_time).count() > 0:
-        return True
-    return False
-
-
-def get_duplicate_idx(lst):
-    for i, argument in enumerate(lst):
-        meeting = None
-        if hasattr(argument, 'id'):
-            meeting = get_object_from_global_id(models.Meeting, argument.id)
-
-        space = get_object_from_global_id(models.Space, argument.space_id)
-        zoom = get_object_from_global_id(models.Zoom, argument.zoom_id)
-        start_time = argument.start_time
-        end_time = argument.end_time
-
-        if space and is_duplicated_space(space, start_time, end_time, meeting):
-            return True, i, Error(key=const.MannaError.DUPLICATED, message="space duplicate time")
-        if zoom and is_duplicated_zoom(zoom, start_time, end_time, meeting):
-            return True, i, Error(key=const.MannaError.ZOOM_DUPLICATED, message="zoom duplicate time")
-        if start_time > end_time:
-            return True, i, Error(key=const.MannaError.INVALID_TIME, message="invalid time")
-
-    return False, -1, None
+    conflicts = find_conflicts(reservations)
+    return [IndexedError(idx=i, error=Error(key=key, message=message))
+            for i, (key, message) in sorted(conflicts.items())]
 
 
 class MeetingInput(graphene.InputObjectType):
@@ -70,6 +50,12 @@ class MeetingInput(graphene.InputObjectType):
     end_time = graphene.types.datetime.DateTime(required=True)
 
 
+class CheckInInput(graphene.InputObjectType):
+    meeting_id = graphene.ID(required=True)
+    # the signed-in user when omitted
+    user_id = graphene.ID()
+
+
 class MeetingUpdateInput(graphene.InputObjectType):
     id = graphene.ID(required=True)
     space_id = graphene.ID()
@@ -79,12 +65,14 @@ class MeetingUpdateInput(graphene.InputObjectType):
     end_time = graphene.types.datetime.DateTime()
 
 
+@cache_control(max_age=300)
 class ProgramTag(DjangoObjectType):
     type = graphene.Field(ProgramTagType)
 
     class Meta:
         model = models.ProgramTag
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
 
     @staticmethod
     def resolve_type(root, info, **kwargs):
@@ -95,16 +83,65 @@ class ProgramParicipant(DjangoObjectType):
     class Meta:
         model = models.ProgramParticipant
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
+
+    @staticmethod
+    def resolve_program(root, info, **kwargs):
+        return load_related(root, info, 'program')
+
+    @staticmethod
+    def resolve_participant(root, info, **kwargs):
+        return load_related(root, info, 'participant')
 
 
 class MeetingParicipant(DjangoObjectType):
     class Meta:
         model = models.MeetingParticipant
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
+
+    @staticmethod
+    def resolve_meeting(root, info, **kwargs):
+        return load_related(root, info, 'meeting')
+
+    @staticmethod
+    def resolve_participant(root, info, **kwargs):
+        return load_related(root, info, 'participant')
+
+
+class ProgramWaiter(DjangoObjectType):
+    class Meta:
+        model = models.ProgramWaiter
+        interfaces = (graphene.Node,)
+        connection_class = CountableConnection
+
+    @staticmethod
+    def resolve_program(root, info, **kwargs):
+        return load_related(root, info, 'program')
+
+    @staticmethod
+    def resolve_participant(root, info, **kwargs):
+        return load_related(root, info, 'participant')
+
+
+class MeetingWaiter(DjangoObjectType):
+    class Meta:
+        model = models.MeetingWaiter
+        interfaces = (graphene.Node,)
+        connection_class = CountableConnection
+
+    @staticmethod
+    def resolve_meeting(root, info, **kwargs):
+        return load_related(root, info, 'meeting')
+
+    @staticmethod
+    def resolve_participant(root, info, **kwargs):
+        return load_related(root, info, 'participant')
 
 
 class CreateProgram(graphene.Mutation):
     program = graphene.Field(Program)
+    error = graphene.Field(Error)
 
     class Arguments:
         name = graphene.String(required=True)
@@ -121,26 +158,31 @@ class CreateProgram(graphene.Mutation):
     def mutate(root, info, **kwargs):
         name = kwargs.get('name')
         description = kwargs.get('description', '')
-        space = get_object_from_global_id(models.Space, kwargs.get('space_id'))
+        space = get_object_from_global_id(models.Space, kwargs.get('space_id'), info.context)
         state = kwargs.get('state', const.ProgramStateEnum.INVITING.value)
         participants_min = kwargs.get('participants_min', 1)
         participants_max = kwargs.get('participants_max', 10)
         required_man_class = kwargs.get('required_man_class', const.ManClassEnum.NON_MEMBER.value)
-        tag = get_object_from_global_id(models.ProgramTag, kwargs.get('tag_id'))
+        tag = get_object_from_global_id(models.ProgramTag, kwargs.get('tag_id'), info.context)
 
         user = info.context.user
 
-        program = models.Program.objects.create(name=name,
-                                                description=description,
-                                                space=space,
-                                                state=state,
-                                                participants_max=participants_max,
-                                                participants_min=participants_min,
-                                                required_man_class=required_man_class,
-                                                tag=tag,
-                                                owner=user)
-
-        models.ProgramParticipant.objects.create(program=program, participant=user)
+        try:
+            with transaction.atomic():
+                program = models.Program.objects.create(name=name,
+                                                        description=description,
+                                                        space=space,
+                                                        state=state,
+                                                        participants_max=participants_max,
+                                                        participants_min=participants_min,
+                                                        required_man_class=required_man_class,
+                                                        tag=tag,
+                                                        owner=user)
+
+                models.ProgramParticipant.objects.create(program=program, participant=user)
+        except models.NoSeatLeft:
+            return CreateProgram(error=Error(key=const.MannaError.INVALID_PARAMETER,
+                                             message="participants_max leaves no seat for the owner."))
 
         return CreateProgram(program=program)
 
@@ -168,6 +210,7 @@ class UpdateProgram(graphene.Mutation):
             return DeleteProgram(error=Error(key=const.MannaError.INVALID_PERMISSION, message="invalid permission"))
 
         program = info.context.program
+        participants_max = program.participants_max
 
         assign(kwargs, program, 'name')
         assign(kwargs, program, 'description')
@@ -178,15 +221,18 @@ class UpdateProgram(graphene.Mutation):
 
         space_id = kwargs.get('space_id')
         if space_id:
-            space = get_object_from_global_id(models.Space, space_id)
+            space = get_object_from_global_id(models.Space, space_id, info.context)
             program.space = space
 
         tag_id = kwargs.get('tag_id')
         if tag_id:
-            tag = get_object_from_global_id(models.ProgramTag, tag_id)
+            tag = get_object_from_global_id(models.ProgramTag, tag_id, info.context)
             program.tag = tag
 
-        program.save()
+        with transaction.atomic():
+            program.save()
+            # waiters take the seats a larger participants_max adds, a leave is not the only way in
+            models.fill_seats(program, program.participants_max - participants_max)
 
         return UpdateProgram(program=program)
 
@@ -221,27 +267,27 @@ class CreateMeeting(graphene.Mutation):
     def mutate(root, info, **kwargs):
         argument = kwargs.get('argument')
         name = argument.name
-        program = get_object_from_global_id(models.Program, argument.program_id)
-        space = get_object_from_global_id(models.Space, argument.space_id)
-        zoom = get_object_from_global_id(models.Zoom, argument.zoom_id)
+        program = get_object_from_global_id(models.Program, argument.program_id, info.context)
+        space = get_object_from_global_id(models.Space, argument.space_id, info.context)
+        zoom = get_object_from_global_id(models.Zoom, argument.zoom_id, info.context)
         start_time = argument.start_time
         end_time = argument.end_time
 
-        # check to duplicate reservations
-        if space and is_duplicated_space(space, start_time, end_time):
-            return CreateMeeting(error=Error(key=const.MannaError.DUPLICATED, message="space duplicate time"))
-        if zoom and is_duplicated_zoom(zoom, start_time, end_time):
-            return CreateMeeting(error=Error(key=const.MannaError.ZOOM_DUPLICATED, message="zoom duplicate time"))
-
         if start_time > end_time:
             return CreateMeeting(error=Error(key=const.MannaError.INVALID_TIME, message="invalid time"))
 
-        meeting = models.Meeting.objects.create(name=name,
-                                                program=program,
-                                                space=space,
-                                                zoom=zoom,
-                                                start_time=start_time,
-                                                end_time=end_time)
+        meeting = models.Meeting(name=name,
+                                 program=program,
+                                 space=space,
+                                 zoom=zoom,
+                                 start_time=start_time,
+                                 end_time=end_time)
+
+        # duplicate reservations are rejected by the exclusion constraints
+        conflict = save_meeting(meeting)
+        if conflict:
+            key, message = conflict
+            return CreateMeeting(error=Error(key=key, message=message))
 
         return CreateMeeting(meeting=meeting)
 
@@ -273,23 +319,17 @@ class UpdateMeeting(graphene.Mutation):
 
         space_id = kwargs.get('space_id')
         if space_id:
-            space = get_object_from_global_id(models.Space, space_id)
-
-            # check to duplicate reservations
-            if is_duplicated_space(space, meeting.start_time, meeting.end_time):
-                return UpdateMeeting(error=Error(key=const.MannaError.DUPLICATED, message="space duplicate time"))
-            meeting.space = space
+            meeting.space = get_object_from_global_id(models.Space, space_id, info.context)
 
         zoom_id = kwargs.get('zoom_id')
         if zoom_id:
-            zoom = get_object_from_global_id(models.Zoom, zoom_id)
-
-            # check to duplicate reservations
-            if is_duplicated_zoom(zoom, meeting.start_time, meeting.end_time):
-                return UpdateMeeting(error=Error(key=const.MannaError.ZOOM_DUPLICATED, message="zoom duplicate time"))
-            meeting.zoom = zoom
+            meeting.zoom = get_object_from_global_id(models.Zoom, zoom_id, info.context)
 
-        meeting.save()
+        # duplicate reservations are rejected by the exclusion constraints
+        conflict = save_meeting(meeting)
+        if conflict:
+            key, message = conflict
+            return UpdateMeeting(error=Error(key=key, message=message))
 
         return UpdateMeeting(meeting=meeting)
 
@@ -312,6 +352,7 @@ class CreateMeetings(graphene.Mutation):
     meetings = graphene.List(Meeting)
     error_idx = graphene.Int()
     error = graphene.Field(Error)
+    errors = graphene.List(IndexedError)
 
     class Arguments:
         argument = graphene.Argument(graphene.List(MeetingInput), required=True)
@@ -319,21 +360,32 @@ class CreateMeetings(graphene.Mutation):
     @staticmethod
     @authorization
     def mutate(root, info, **kwargs):
-        ok, i, err = get_duplicate_idx(kwargs.get('argument'))
-        if ok:
-            return CreateMeetings(error_idx=i, error=err)
+        errors = get_conflicts(kwargs.get('argument'))
+        if errors:
+            return CreateMeetings(error_idx=errors[0].idx, error=errors[0].error, errors=errors)
+
+        arguments = kwargs.get('argument')
+        programs = get_objects_from_global_ids(models.Program, [x.program_id for x in arguments], info.context)
+        spaces = get_objects_from_global_ids(models.Space, [x.space_id for x in arguments], info.context)
+        zooms = get_objects_from_global_ids(models.Zoom, [x.zoom_id for x in arguments], info.context)
+
+        meetings = [models.Meeting(name=argument.name,
+                                   program=programs.get(get_pk_from_global_id(argument.program_id)),
+                                   space=spaces.get(get_pk_from_global_id(argument.space_id)),
+                                   zoom=zooms.get(get_pk_from_global_id(argument.zoom_id)),
+                                   start_time=argument.start_time,
+                                   end_time=argument.end_time) for argument in arguments]
+
+        errors = [IndexedError(idx=i, error=Error(key=const.MannaError.DOES_NOT_EXIST, message="invalid program"))
+                  for i, meeting in enumerate(meetings) if meeting.program_id is None]
+        if errors:
+            return CreateMeetings(error_idx=errors[0].idx, error=errors[0].error, errors=errors)
+
+        meetings, conflict = bulk_save_meetings(meetings)
+        if conflict:
+            key, message = conflict
+            return CreateMeetings(error=Error(key=key, message=message))
 
-        meetings = []
-        for argument in kwargs.get('argument'):
-            name = argument.name
-            program = get_object_from_global_id(models.Program, argument.program_id)
-            space = get_object_from_global_id(models.Space, argument.space_id)
-            zoom = get_object_from_global_id(models.Zoom, argument.zoom_id)
-            start_time = argument.start_time
-            end_time = argument.end_time
-
-            meetings.append(models.Meeting.objects.create(name=name, program=program, space=space, zoom=zoom,
-                                                          start_time=start_time, end_time=end_time))
         return CreateMeetings(meetings=meetings, error_idx=-1)
 
 
@@ -341,6 +393,7 @@ class UpdateMeetings(graphene.Mutation):
     meetings = graphene.List(Meeting)
     error_idx = graphene.Int()
     error = graphene.Field(Error)
+    errors = graphene.List(IndexedError)
 
     class Arguments:
         argument = graphene.Argument(graphene.List(MeetingUpdateInput), required=True)
@@ -348,22 +401,36 @@ class UpdateMeetings(graphene.Mutation):
     @staticmethod
     @authorization
     def mutate(root, info, **kwargs):
-        ok, i, err = get_duplicate_idx(kwargs.get('argument'))
-        if ok:
-            return UpdateMeetings(error_idx=i, error=err)
+        errors = get_conflicts(kwargs.get('argument'))
+        if errors:
+            return UpdateMeetings(error_idx=errors[0].idx, error=errors[0].error, errors=errors)
 
-        meetings = []
-        for argument in kwargs.get('argument'):
-            meeting = get_object_from_global_id(models.Meeting, argument.id)
-            meeting.name = argument.name
-            meeting.start_time = argument.start_time
-            meeting.end_time = argument.end_time
+        # one query per model for the whole batch, the lookups below hit the identity map
+        arguments = kwargs.get('argument')
+        get_objects_from_global_ids(models.Meeting, [x.id for x in arguments], info.context)
+        get_objects_from_global_ids(models.Space, [x.space_id for x in arguments], info.context)
+        get_objects_from_global_ids(models.Zoom, [x.zoom_id for x in arguments], info.context)
 
-            meeting.space = get_object_from_global_id(models.Space, argument.space_id)
-            meeting.zoom = get_object_from_global_id(models.Zoom, argument.zoom_id)
-
-            meeting.save()
-            meetings.append(meeting)
+        meetings = []
+        with transaction.atomic():
+            for i, argument in enumerate(arguments):
+                meeting = get_object_from_global_id(models.Meeting, argument.id, info.context)
+                meeting.name = argument.name
+                meeting.start_time = argument.start_time
+                meeting.end_time = argument.end_time
+
+                meeting.space = get_object_from_global_id(models.Space, argument.space_id, info.context)
+                meeting.zoom = get_object_from_global_id(models.Zoom, argument.zoom_id, info.context)
+
+                # items are saved one by one, so swapping slots inside a batch can still hit the constraints
+                conflict = save_meeting(meeting)
+                if conflict:
+                    transaction.set_rollback(True)
+                    key, message = conflict
+                    error = Error(key=key, message=message)
+                    return UpdateMeetings(error_idx=i, error=error, errors=[IndexedError(idx=i, error=error)])
+
+                meetings.append(meeting)
 
         return UpdateMeetings(meetings=meetings, error_idx=-1)
 
@@ -379,18 +446,18 @@ class ParticipateProgram(graphene.Mutation):
     @authorization
     def mutate(root, info, **kwargs):
         user = info.context.user
-        program = get_object_from_global_id(models.Program, kwargs.get('program_id'))
+        program = get_object_from_global_id(models.Program, kwargs.get('program_id'), info.context)
 
         if program.state in [const.ProgramStateEnum.END.value, const.ProgramStateEnum.SUSPEND.value]:
             return ParticipateProgram(error=Error(key=const.MannaError.EXPIRED,
                                                   message="the program is expired."))
 
-        if models.ProgramParticipant.objects.filter(program=program).count() >= program.participants_max:
+        try:
+            program_participant = models.ProgramParticipant.objects.create(program=program, participant=user)
+        except models.NoSeatLeft:
             return ParticipateProgram(error=Error(key=const.MannaError.MAX_PARTICIPANT,
                                                   message="the participants have been exceeded."))
 
-        program_participant = models.ProgramParticipant.objects.create(program=program, participant=user)
-
         return ParticipateProgram(program_participant=program_participant)
 
 
@@ -406,10 +473,10 @@ class LeaveProgram(graphene.Mutation):
     @authorization
     def mutate(root, info, **kwargs):
         user = info.context.user
-        program = get_object_from_global_id(models.Program, kwargs.get('program_id'))
-        target_user = get_object_from_global_id(models.Profile, kwargs.get('user_id'))
+        program = get_object_from_global_id(models.Program, kwargs.get('program_id'), info.context)
+        target_user = get_object_from_global_id(models.Profile, kwargs.get('user_id'), info.context)
 
-        if user == program.owner or user.role == const.ManClassEnum.ADMIN.value or user == target_user:
+        if user.id == program.owner_id or user.role == const.ManClassEnum.ADMIN.value or user == target_user:
             models.ProgramParticipant.objects.get(program=program, participant=target_user).delete()
             return LeaveProgram(program=program)
 
@@ -426,7 +493,7 @@ class LeaveMeeting(graphene.Mutation):
     @authorization
     def mutate(root, info, **kwargs):
         user = info.context.user
-        meeting = get_object_from_global_id(models.Meeting, kwargs.get('meeting_id'))
+        meeting = get_object_from_global_id(models.Meeting, kwargs.get('meeting_id'), info.context)
 
         models.MeetingParticipant.objects.get(meeting=meeting, participant=user).delete()
         return LeaveMeeting(meeting=meeting)
@@ -443,22 +510,229 @@ class ParticipateMeeting(graphene.Mutation):
     @authorization
     def mutate(root, info, **kwargs):
         user = info.context.user
-        meeting = get_object_from_global_id(models.Meeting, kwargs.get('meeting_id'))
+        meeting = get_object_from_global_id(models.Meeting, kwargs.get('meeting_id'), info.context)
 
-        if models.MeetingParticipant.objects.filter(meeting=meeting).count() >= meeting.program.participants_max:
-            return ParticipateProgram(error=Error(key=const.MannaError.MAX_PARTICIPANT,
+        try:
+            meeting_participant = models.MeetingParticipant.objects.create(meeting=meeting, participant=user)
+        except models.NoSeatLeft:
+            return ParticipateMeeting(error=Error(key=const.MannaError.MAX_PARTICIPANT,
                                                   message="the participants have been exceeded."))
 
-        meeting_participant = models.MeetingParticipant.objects.create(meeting=meeting, participant=user)
-
         return ParticipateMeeting(meeting_participant=meeting_participant)
 
 
+class EnrollParticipants(graphene.Mutation):
+    program = graphene.Field(Program)
+    errors = graphene.List(IndexedError)
+    error = graphene.Field(Error)
+
+    class Arguments:
+        program_id = graphene.ID(required=True)
+        user_ids = graphene.List(graphene.ID, required=True)
+
+    @staticmethod
+    @authorization
+    def mutate(root, info, **kwargs):
+        program = get_object_from_global_id(models.Program, kwargs.get('program_id'), info.context)
+        if program is None:
+            return EnrollParticipants(error=Error(key=const.MannaError.DOES_NOT_EXIST, message="invalid program"))
+
+        if not is_editable_program(program, info.context.user):
+            return EnrollParticipants(error=Error(key=const.MannaError.INVALID_PERMISSION,
+                                                  message="invalid permission"))
+
+        if program.state in [const.ProgramStateEnum.END.value, const.ProgramStateEnum.SUSPEND.value]:
+            return EnrollParticipants(error=Error(key=const.MannaError.EXPIRED, message="the program is expired."))
+
+        user_ids = [get_pk_from_global_id(x) for x in kwargs.get('user_ids')]
+        profiles = get_objects_from_global_ids(models.Profile, kwargs.get('user_ids'), info.context)
+        enrolled, existing = models.enroll_participants(program, [x for x in user_ids if x in profiles])
+
+        enrolled = set(enrolled)
+        errors = []
+        for idx, user_id in enumerate(user_ids):
+            if user_id not in profiles:
+                errors.append(IndexedError(idx=idx, error=Error(key=const.MannaError.DOES_NOT_EXIST,
+                                                                message="no such user")))
+            elif user_id in existing:
+                errors.append(IndexedError(idx=idx, error=Error(key=const.MannaError.DUPLICATED,
+                                                                message="already participating")))
+            elif user_id not in enrolled:
+                errors.append(IndexedError(idx=idx, error=Error(key=const.MannaError.MAX_PARTICIPANT,
+                                                                message="the participants have been exceeded.")))
+
+        return EnrollParticipants(program=program, errors=errors)
+
+
+class RemoveParticipants(graphene.Mutation):
+    program = graphene.Field(Program)
+    errors = graphene.List(IndexedError)
+    error = graphene.Field(Error)
+
+    class Arguments:
+        program_id = graphene.ID(required=True)
+        user_ids = graphene.List(graphene.ID, required=True)
+
+    @staticmethod
+    @authorization
+    def mutate(root, info, **kwargs):
+        program = get_object_from_global_id(models.Program, kwargs.get('program_id'), info.context)
+        if program is None:
+            return RemoveParticipants(error=Error(key=const.MannaError.DOES_NOT_EXIST, message="invalid program"))
+
+        if not is_editable_program(program, info.context.user):
+            return RemoveParticipants(error=Error(key=const.MannaError.INVALID_PERMISSION,
+                                                  message="invalid permission"))
+
+        user_ids = [get_pk_from_global_id(x) for x in kwargs.get('user_ids')]
+        removed = set(models.remove_participants(program, [x for x in user_ids if x is not None]))
+
+        errors = [IndexedError(idx=idx, error=Error(key=const.MannaError.DOES_NOT_EXIST,
+                                                    message="not participating"))
+                  for idx, user_id in enumerate(user_ids) if user_id not in removed]
+        return RemoveParticipants(program=program, errors=errors)
+
+
+class WaitProgram(graphene.Mutation):
+    program_participant = graphene.Field(ProgramParicipant)
+    program_waiter = graphene.Field(ProgramWaiter)
+    error = graphene.Field(Error)
+
+    class Arguments:
+        program_id = graphene.ID(required=True)
+
+    @staticmethod
+    @authorization
+    def mutate(root, info, **kwargs):
+        user = info.context.user
+        program = get_object_from_global_id(models.Program, kwargs.get('program_id'), info.context)
+
+        if program.state in [const.ProgramStateEnum.END.value, const.ProgramStateEnum.SUSPEND.value]:
+            return WaitProgram(error=Error(key=const.MannaError.EXPIRED, message="the program is expired."))
+
+        if models.ProgramParticipant.objects.filter(program=program, participant=user).exists():
+            return WaitProgram(error=Error(key=const.MannaError.DUPLICATED, message="already participating"))
+
+        # a free seat is taken right away, otherwise the user is queued once and promoted by a leave.
+        # the program row stays locked in between, so a leave's release_seat waits and then sees the waiter
+        with transaction.atomic():
+            models.Program.objects.select_for_update().get(id=program.id)
+            try:
+                program_participant = models.ProgramParticipant.objects.create(program=program, participant=user)
+                return WaitProgram(program_participant=program_participant)
+            except models.NoSeatLeft:
+                program_waiter, _ = models.ProgramWaiter.objects.get_or_create(program=program, participant=user)
+                return WaitProgram(program_waiter=program_waiter)
+
+
+class CancelWaitProgram(graphene.Mutation):
+    ok = graphene.Boolean()
+
+    class Arguments:
+        program_id = graphene.ID(required=True)
+
+    @staticmethod
+    @authorization
+    def mutate(root, info, **kwargs):
+        program = get_object_from_global_id(models.Program, kwargs.get('program_id'), info.context)
+
+        deleted, _ = models.ProgramWaiter.objects.filter(program=program, participant=info.context.user).delete()
+        return CancelWaitProgram(ok=deleted > 0)
+
+
+class WaitMeeting(graphene.Mutation):
+    meeting_participant = graphene.Field(MeetingParicipant)
+    meeting_waiter = graphene.Field(MeetingWaiter)
+    error = graphene.Field(Error)
+
+    class Arguments:
+        meeting_id = graphene.ID(required=True)
+
+    @staticmethod
+    @authorization
+    def mutate(root, info, **kwargs):
+        user = info.context.user
+        meeting = get_object_from_global_id(models.Meeting, kwargs.get('meeting_id'), info.context)
+
+        if models.MeetingParticipant.objects.filter(meeting=meeting, participant=user).exists():
+            return WaitMeeting(error=Error(key=const.MannaError.DUPLICATED, message="already participating"))
+
+        with transaction.atomic():
+            models.Meeting.objects.select_for_update().get(id=meeting.id)
+            try:
+                meeting_participant = models.MeetingParticipant.objects.create(meeting=meeting, participant=user)
+                return WaitMeeting(meeting_participant=meeting_participant)
+            except models.NoSeatLeft:
+                meeting_waiter, _ = models.MeetingWaiter.objects.get_or_create(meeting=meeting, participant=user)
+                return WaitMeeting(meeting_waiter=meeting_waiter)
+
+
+class CancelWaitMeeting(graphene.Mutation):
+    ok = graphene.Boolean()
+
+    class Arguments:
+        meeting_id = graphene.ID(required=True)
+
+    @staticmethod
+    @authorization
+    def mutate(root, info, **kwargs):
+        meeting = get_object_from_global_id(models.Meeting, kwargs.get('meeting_id'), info.context)
+
+        deleted, _ = models.MeetingWaiter.objects.filter(meeting=meeting, participant=info.context.user).delete()
+        return CancelWaitMeeting(ok=deleted > 0)
+
+
+class CheckIn(graphene.Mutation):
+    ok = graphene.Boolean()
+    error = graphene.Field(Error)
+    errors = graphene.List(IndexedError)
+
+    class Arguments:
+        argument = graphene.Argument(graphene.List(CheckInInput), required=True)
+
+    @staticmethod
+    @authorization
+    def mutate(root, info, **kwargs):
+        user = info.context.user
+        argument = kwargs.get('argument')
+        if len(argument) > settings.ATTENDANCE_BATCH_SIZE:
+            return CheckIn(error=Error(key=const.MannaError.TOO_MANY, message="too many check-ins"))
+
+        pairs = [(get_pk_from_global_id(x.meeting_id), get_pk_from_global_id(x.user_id) if x.user_id else user.id)
+                 for x in argument]
+        seats = get_seats(list(dict.fromkeys(x for x in pairs if x[0] is not None)))
+
+        accepted = []
+        errors = []
+        for idx, pair in enumerate(pairs):
+            if pair not in seats:
+                errors.append(IndexedError(idx=idx, error=Error(key=const.MannaError.DOES_NOT_EXIST,
+                                                                message="no such meeting")))
+                continue
+
+            owner_id, found, seated = seats[pair]
+            if not found:
+                errors.append(IndexedError(idx=idx, error=Error(key=const.MannaError.DOES_NOT_EXIST,
+                                                                message="no such user")))
+            elif pair[1] != user.id and user.role != const.ManClassEnum.ADMIN.value and owner_id != user.id:
+                errors.append(IndexedError(idx=idx, error=Error(key=const.MannaError.INVALID_PERMISSION,
+                                                                message="invalid permission")))
+            elif not seated:
+                errors.append(IndexedError(idx=idx, error=Error(key=const.MannaError.DOES_NOT_EXIST,
+                                                                message="not participating")))
+            else:
+                accepted.append(pair)
+
+        # written behind, together with the check-ins of other requests
+        attendance.add(accepted)
+        return CheckIn(ok=not errors, errors=errors)
+
+
 class ProgramQuery(graphene.ObjectType):
     program = graphene.Field(Program, id=graphene.ID(required=True))
     meeting = graphene.Field(Meeting, id=graphene.ID(required=True))
-    all_programs = DjangoFilterConnectionField(Program)
-    all_meetings = DjangoFilterConnectionField(Meeting, program_id=graphene.ID())
+    all_programs = KeysetConnectionField(Program)
+    all_meetings = KeysetConnectionField(Meeting, program_id=graphene.ID())
     program_tags = graphene.List(ProgramTag)
     zooms = graphene.Field(graphene.List(Meeting),
                            year=graphene.Int(required=True),
@@ -467,17 +741,19 @@ class ProgramQuery(graphene.ObjectType):
 
     @staticmethod
     def resolve_program(root, info, **kwargs):
-        program = get_object_from_global_id(models.Program, kwargs.get('id'))
+        program = get_object_from_global_id(optimize(models.Program.objects.all(), info), kwargs.get('id'))
         return program
 
     @staticmethod
     def resolve_meeting(root, info, **kwargs):
-        meeting = get_object_from_global_id(models.Meeting, kwargs.get('id'))
+        meeting = get_object_from_global_id(optimize(models.Meeting.objects.all(), info), kwargs.get('id'))
         return meeting
 
     @staticmethod
+    @cache_control(max_age=60)
     def resolve_all_programs(root, info, **kwargs):
-        return models.Program.objects.filter(state=const.ProgramStateEnum.PROGRESS.value)
+        programs = models.Program.objects.filter(state=const.ProgramStateEnum.PROGRESS.value)
+        return optimize(programs, info)
 
     @staticmethod
     def resolve_all_meetings(root, info, **kwargs):
@@ -485,15 +761,15 @@ class ProgramQuery(graphene.ObjectType):
 
         program_id = kwargs.get('program_id')
         if program_id:
-            program = get_object_from_global_id(models.Program, program_id)
+            program = get_object_from_global_id(models.Program, program_id, info.context)
             meetings = meetings.filter(program=program)
 
-        return meetings
+        return optimize(meetings, info)
 
     @staticmethod
-    @authorization
+    @cache_control(max_age=300)
     def resolve_program_tags(root, info, **kwargs):
-        return models.ProgramTag.objects.filter(is_active=True)
+        return program_tags.all()
 
     @staticmethod
     @authorization
@@ -520,8 +796,9 @@ class ProgramQuery(graphene.ObjectType):
         if enable_tomorrow:
             end_date += datetime.timedelta(days=1)
 
-        return models.Meeting.objects.filter(zoom__isnull=False,
-                                             start_time__range=(start_date, end_date))
+        meetings = models.Meeting.objects.filter(zoom__isnull=False,
+                                                 start_time__range=(start_date, end_date))
+        return optimize(meetings, info)
 
 
 class ProgramMutation(graphene.ObjectType):
@@ -538,3 +815,10 @@ class ProgramMutation(graphene.ObjectType):
     leave_program = LeaveProgram.Field()
     participate_meeting = ParticipateMeeting.Field()
     leave_meeting = LeaveMeeting.Field()
+    enroll_participants = EnrollParticipants.Field()
+    remove_participants = RemoveParticipants.Field()
+    wait_program = WaitProgram.Field()
+    cancel_wait_program = CancelWaitProgram.Field()
+    wait_meeting = WaitMeeting.Field()
+    cancel_wait_meeting = CancelWaitMeeting.Field()
+    check_in = CheckIn.Field()
@@ -1,14 +1,18 @@
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 
 from django_server import const
 from django_server import models
 from django_server.graphene.base import ManClass, SpaceState
+from django_server.graphene.cache import cache_control
+from django_server.graphene.connection import CountableConnection, KeysetConnectionField
+from django_server.graphene.loader import load_related
+from django_server.graphene.optimizer import optimize
 from django_server.graphene.utils import assign, has_building, has_space, get_object_from_global_id
 from django_server.libs.authentification import authorization
 
 
+@cache_control(max_age=300)
 class Space(DjangoObjectType):
     state = graphene.Field(SpaceState)
     required_man_class = graphene.Field(ManClass)
@@ -19,6 +23,7 @@ class Space(DjangoObjectType):
             'name': ['exact', 'icontains'],
         }
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
         exclude_fields = ('state', 'required_man_class')
 
     @staticmethod
@@ -29,7 +34,16 @@ class Space(DjangoObjectType):
     def resolve_required_man_class(root, info, **kwargs):
         return root.required_man_class
 
+    @staticmethod
+    def resolve_building(root, info, **kwargs):
+        return load_related(root, info, 'building')
+
+    @staticmethod
+    def resolve_made_user(root, info, **kwargs):
+        return load_related(root, info, 'made_user')
 
+
+@cache_control(max_age=300)
 class Building(DjangoObjectType):
     class Meta:
         model = models.Building
@@ -38,6 +52,11 @@ class Building(DjangoObjectType):
             'address': ['exact', 'icontains'],
         }
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
+
+    @staticmethod
+    def resolve_made_user(root, info, **kwargs):
+        return load_related(root, info, 'made_user')
 
 
 class Zoom(DjangoObjectType):
@@ -47,6 +66,7 @@ class Zoom(DjangoObjectType):
             'name': ['exact', 'icontains'],
         }
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
 
 
 class CreateBuilding(graphene.Mutation):
@@ -130,7 +150,7 @@ class CreateSpace(graphene.Mutation):
         name = kwargs.get('name')
         required_man_class = kwargs.get('required_man_class', const.ManClassEnum.NON_MEMBER.value)
         state = kwargs.get('state', const.SpaceStateEnum.WATING.value)
-        building = get_object_from_global_id(models.Building, kwargs.get('building_id'))
+        building = get_object_from_global_id(models.Building, kwargs.get('building_id'), info.context)
         user = info.context.user
 
         space = models.Space.objects.create(name=name,
@@ -164,7 +184,7 @@ class UpdateSpace(graphene.Mutation):
 
         building_id = kwargs.get('building_id')
         if building_id:
-            building = get_object_from_global_id(models.Building, building_id)
+            building = get_object_from_global_id(models.Building, building_id, info.context)
             space.building = building
 
         space.save()
@@ -190,21 +210,35 @@ class SpaceQuery(graphene.ObjectType):
     space = graphene.Field(Space, id=graphene.ID(required=True))
     building = graphene.Field(Building, id=graphene.ID(required=True))
     zoom = graphene.Field(Zoom, id=graphene.ID(required=True))
-    all_spaces = DjangoFilterConnectionField(Space)
-    all_buildings = DjangoFilterConnectionField(Building)
-    all_zooms = DjangoFilterConnectionField(Zoom)
+    all_spaces = KeysetConnectionField(Space)
+    all_buildings = KeysetConnectionField(Building)
+    all_zooms = KeysetConnectionField(Zoom)
 
     @staticmethod
     def resolve_space(root, info, **kwargs):
-        return get_object_from_global_id(models.Space, kwargs.get('id'))
+        return get_object_from_global_id(optimize(models.Space.objects.all(), info), kwargs.get('id'))
 
     @staticmethod
     def resolve_building(root, info, **kwargs):
-        return get_object_from_global_id(models.Building, kwargs.get('id'))
+        return get_object_from_global_id(optimize(models.Building.objects.all(), info), kwargs.get('id'))
 
     @staticmethod
     def resolve_zoom(root, info, **kwargs):
-        return get_object_from_global_id(models.Zoom, kwargs.get('id'))
+        return get_object_from_global_id(optimize(models.Zoom.objects.all(), info), kwargs.get('id'))
+
+    @staticmethod
+    @cache_control(max_age=300)
+    def resolve_all_spaces(root, info, **kwargs):
+        return optimize(models.Space.objects.all(), info)
+
+    @staticmethod
+    @cache_control(max_age=300)
+    def resolve_all_buildings(root, info, **kwargs):
+        return optimize(models.Building.objects.all(), info)
+
+    @staticmethod
+    def resolve_all_zooms(root, info, **kwargs):
+        return optimize(models.Zoom.objects.all(), info)
 
 
 class SpaceMutation(graphene.ObjectType):
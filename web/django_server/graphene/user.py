@@ -1,15 +1,23 @@
 import logging
 
 import graphene
-from django.contrib import auth
+from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.utils import timezone
 from graphene_django import DjangoObjectType
+from promise import Promise
 
 from django_server import models
 from django_server.const import ProgramStateEnum, MannaError
 from django_server.graphene.base import UserStatus, ManClass, Program, Meeting, Error
+from django_server.graphene.connection import CountableConnection
+from django_server.graphene.cost import query_cost
+from django_server.graphene.loader import load_related
+from django_server.graphene.optimizer import optimize, requires
+from django_server.libs.activity import activity
 from django_server.libs.authentification import AuthHelper, authorization
+from django_server.libs.hashing import HashingBusy
+from django_server.libs.throttle import allow_signin
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +33,17 @@ class Profile(DjangoObjectType):
     class Meta:
         model = models.Profile
         interfaces = (graphene.Node,)
+        connection_class = CountableConnection
 
     @staticmethod
     def resolve_name(root, info):
         return root.name
 
     @staticmethod
+    @query_cost(1)
+    @requires('user_id')
     def resolve_email(root, info):
-        return root.user.email
+        return Promise.resolve(load_related(root, info, 'user')).then(lambda user: user.email)
 
     @staticmethod
     def resolve_status(root, info):
@@ -44,24 +55,27 @@ class Profile(DjangoObjectType):
 
     @staticmethod
     def resolve_programs(root, info, **kwargs):
-        return [
-            x.program for x in models.ProgramParticipant.objects.filter(participant=info.context.user)
-            if x.program.state != ProgramStateEnum.END.value
-        ]
+        programs = models.Program.objects.filter(program_participant__participant=info.context.user) \
+            .exclude(state=ProgramStateEnum.END.value) \
+            .order_by('program_participant__created_at')
+        return optimize(programs, info)
 
     @staticmethod
     def resolve_meetings(root, info, **kwargs):
         today = timezone.now()
         joined_program = models.ProgramParticipant.objects.filter(participant=info.context.user).values('program')
 
-        return models.Meeting.objects.filter(start_time__gte=today,
-                                             program__state=ProgramStateEnum.PROGRESS.value,
-                                             program__in=joined_program).order_by('start_time')[:3]
+        meetings = models.Meeting.objects.filter(start_time__gte=today,
+                                                 program__state=ProgramStateEnum.PROGRESS.value,
+                                                 program__in=joined_program).order_by('start_time')
+        return optimize(meetings, info)[:3]
 
 
 class Signin(graphene.Mutation):
     profile = graphene.Field(Profile)
     token = graphene.String()
+    refresh_token = graphene.String()
+    error = graphene.Field(Error)
 
     class Arguments:
         email = graphene.String(required=True)
@@ -72,20 +86,44 @@ class Signin(graphene.Mutation):
         email = kwargs.get('email').strip()
         password = kwargs.get('password').strip()
 
+        # rejected before any hashing
+        if not allow_signin(info.context, email):
+            return Signin(token="", error=Error(key=MannaError.TOO_MANY, message="too many attempts"))
+
         try:
-            user = User.objects.get(username=email)
-            user = auth.authenticate(info.context, username=user.username, password=password)
+            user = authenticate(info.context, username=email, password=password)
+            if user is None:
+                raise User.DoesNotExist()
 
             profile = models.Profile.objects.get(user=user)
 
-            profile.last_login = timezone.now()
-            profile.save()
-            token = AuthHelper.generate_token({"user_id": str(profile.id)})
+            activity.signin(profile.id)
+            token = AuthHelper.generate_token({"user_id": str(profile.id)}, profile)
+            refresh_token = AuthHelper.generate_refresh_token({"user_id": str(profile.id)}, profile)
+        except HashingBusy:
+            return Signin(token="", error=Error(key=MannaError.TOO_MANY, message="try again later"))
         except Exception:
             profile = None
             token = ""
+            refresh_token = ""
+
+        return Signin(profile=profile, token=token, refresh_token=refresh_token)
+
+
+class RefreshToken(graphene.Mutation):
+    token = graphene.String()
+    error = graphene.Field(Error)
+
+    class Arguments:
+        refresh_token = graphene.String(required=True)
+
+    @staticmethod
+    def mutate(root, info, **kwargs):
+        profile = AuthHelper.verify_refresh_token(kwargs.get('refresh_token'))
+        if not profile:
+            return RefreshToken(error=Error(key=MannaError.INVALID_TOKEN, message="invalid refresh token"))
 
-        return Signin(profile=profile, token=token)
+        return RefreshToken(token=AuthHelper.generate_token({"user_id": str(profile.id)}, profile))
 
 
 class Signup(graphene.Mutation):
@@ -137,10 +175,12 @@ class UserQuery(graphene.ObjectType):
     @staticmethod
     @authorization
     def resolve_me(root, info, **kwargs):
-        return info.context.user
+        # the token only carries the id, role and status
+        return models.Profile.objects.select_related('user').get(id=info.context.user.id)
 
 
 class UserMutation(graphene.ObjectType):
     signin = Signin.Field()
+    refresh_token = RefreshToken.Field()
     signup = Signup.Field()
     reset_password = ResetPassword.Field()
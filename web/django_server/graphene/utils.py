@@ -2,9 +2,11 @@ import logging
 from collections import namedtuple
 from functools import wraps
 
+from django.db.models import QuerySet
 from graphql_relay.node.node import from_global_id, to_global_id
 
 from django_server import models
+from django_server.graphene.loader import get_object, get_objects
 
 logger = logging.getLogger(__name__)
 
@@ -27,17 +29,37 @@ def get_local_id_from_global_id(global_id):
     return rid.id
 
 
-def get_object_from_global_id(obj, global_id):
+def get_pk_from_global_id(global_id):
     try:
-        return obj.objects.get(pk=get_local_id_from_global_id(global_id))
+        return int(get_local_id_from_global_id(global_id))
     except Exception:
         return None
 
 
+def get_object_from_global_id(obj, global_id, context=None):
+    # with a context, models are looked up through the request's identity map
+    if context is not None and not isinstance(obj, QuerySet):
+        return get_object(context, obj, get_pk_from_global_id(global_id) if global_id else None)
+
+    queryset = obj if isinstance(obj, QuerySet) else obj.objects
+    try:
+        return queryset.get(pk=get_local_id_from_global_id(global_id))
+    except Exception:
+        return None
+
+
+def get_objects_from_global_ids(obj, global_ids, context=None):
+    pks = {get_pk_from_global_id(x) for x in global_ids if x}
+    pks.discard(None)
+    if context is not None:
+        return get_objects(context, obj, pks)
+    return obj.objects.in_bulk(pks)
+
+
 def has_building(func):
     @wraps(func)
     def wrap(root, info, **kwargs):
-        building = get_object_from_global_id(models.Building, kwargs.get('id'))
+        building = get_object_from_global_id(models.Building, kwargs.get('id'), info.context)
         info.context.building = building
         # TODO compare info.context.user with building.made_user
         return func(root, info, **kwargs)
@@ -47,7 +69,7 @@ def has_building(func):
 def has_space(func):
     @wraps(func)
     def wrap(root, info, **kwargs):
-        space = get_object_from_global_id(models.Space, kwargs.get('id'))
+        space = get_object_from_global_id(models.Space, kwargs.get('id'), info.context)
         info.context.space = space
         # TODO compare info.context.user with space.made_user
         return func(root, info, **kwargs)
@@ -57,7 +79,7 @@ def has_space(func):
 def has_program(func):
     @wraps(func)
     def wrap(root, info, **kwargs):
-        program = get_object_from_global_id(models.Program, kwargs.get('id'))
+        program = get_object_from_global_id(models.Program, kwargs.get('id'), info.context)
         info.context.program = program
         # TODO compare info.context.user with program.owner
         return func(root, info, **kwargs)
@@ -67,7 +89,7 @@ def has_program(func):
 def has_meeting(func):
     @wraps(func)
     def wrap(root, info, **kwargs):
-        meeting = get_object_from_global_id(models.Meeting, kwargs.get('id'))
+        meeting = get_object_from_global_id(models.Meeting, kwargs.get('id'), info.context)
         info.context.meeting = meeting
         # TODO compare info.context.user with meeting.program.owner
         return func(root, info, **kwargs)
@@ -0,0 +1,75 @@
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from django_server.models import Profile
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker(object):
+    # latest signin and last-seen times per profile, kept in memory and written in one UPDATE at most
+    # every `interval` seconds by whichever request comes along after it has passed
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.flushed_at = time.time()
+        self.lock = threading.Lock()
+
+    def signin(self, profile_id, at=None):
+        at = at or datetime.datetime.now()
+        self._record(profile_id, at, at)
+
+    def seen(self, profile_id, at=None):
+        self._record(profile_id, None, at or datetime.datetime.now())
+
+    def _merge(self, profile_id, last_signin, last_seen):
+        signin, seen = self.pending.get(profile_id, (None, None))
+        self.pending[profile_id] = (max(filter(None, (signin, last_signin)), default=None),
+                                    max(filter(None, (seen, last_seen)), default=None))
+
+    def _record(self, profile_id, last_signin, last_seen):
+        with self.lock:
+            self._merge(profile_id, last_signin, last_seen)
+            due = time.time() - self.flushed_at >= self.interval
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.time()
+
+        if not pending:
+            return 0
+
+        rows = [(profile_id, signin, seen) for profile_id, (signin, seen) in pending.items()]
+        values = ', '.join(['(%s, %s::timestamp, %s::timestamp)'] * len(rows))
+        # GREATEST skips NULLs, so a missing or older time never overwrites a newer one
+        sql = f"""
+            UPDATE {Profile._meta.db_table} AS p
+            SET last_signin = GREATEST(p.last_signin, v.last_signin), last_seen = GREATEST(p.last_seen, v.last_seen)
+            FROM (VALUES {values}) AS v(id, last_signin, last_seen)
+            WHERE p.id = v.id
+        """
+        try:
+            # a savepoint, so a failure leaves the transaction of the request usable
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [value for row in rows for value in row])
+        except Exception:
+            # the request that happened to flush must not fail; the rows wait for the next flush
+            logger.exception(f"activity flush failed, {len(rows)} profiles kept")
+            with self.lock:
+                for row in rows:
+                    self._merge(*row)
+            return 0
+        logger.debug(f"activity flushed: {len(rows)} profiles")
+        return len(rows)
+
+
+activity = ActivityTracker(settings.ACTIVITY_FLUSH_SECONDS)
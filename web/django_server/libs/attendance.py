@@ -0,0 +1,101 @@
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+
+from django_server.models import Meeting, MeetingAttendance, MeetingParticipant, Profile, Program
+
+logger = logging.getLogger(__name__)
+
+
+def get_seats(pairs):
+    # {(meeting_id, participant_id): (program owner id, the profile exists, holds a seat)} of the existing
+    # meetings in one query
+    if not pairs:
+        return {}
+
+    values = ', '.join(['(%s::integer, %s::integer)'] * len(pairs))
+    sql = f"""
+        SELECT v.meeting_id, v.participant_id, p.owner_id, pr.id IS NOT NULL, mp.id IS NOT NULL
+        FROM (VALUES {values}) AS v(meeting_id, participant_id)
+        JOIN {Meeting._meta.db_table} AS m ON m.id = v.meeting_id
+        JOIN {Program._meta.db_table} AS p ON p.id = m.program_id
+        LEFT JOIN {Profile._meta.db_table} AS pr ON pr.id = v.participant_id
+        LEFT JOIN {MeetingParticipant._meta.db_table} AS mp
+            ON mp.meeting_id = v.meeting_id AND mp.participant_id = v.participant_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for pair in pairs for value in pair])
+        return {(meeting_id, participant_id): (owner_id, found, seated)
+                for meeting_id, participant_id, owner_id, found, seated in cursor.fetchall()}
+
+
+def insert(rows):
+    # foreign keys are checked before the savepoint is released, not at the end of the request
+    with transaction.atomic():
+        MeetingAttendance.objects.bulk_create(rows, ignore_conflicts=True)
+        connection.check_constraints()
+
+
+class AttendanceBuffer(object):
+    # accepted check-ins of every request, inserted together once `interval` seconds have passed or
+    # `batch_size` are pending, by the next check-in or the worker's PeriodicFlusher.
+    # repeated check-ins are dropped, in memory and by the unique constraint.
+    def __init__(self, interval, batch_size):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self.flushed_at = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, pairs, at=None):
+        at = at or datetime.datetime.now()
+        with self.lock:
+            for pair in pairs:
+                self.pending.setdefault(pair, at)
+            due = len(self.pending) >= self.batch_size or time.time() - self.flushed_at >= self.interval
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.time()
+
+        if not pending:
+            return 0
+
+        rows = [MeetingAttendance(meeting_id=meeting_id, participant_id=participant_id, checked_in_at=at)
+                for (meeting_id, participant_id), at in pending.items()]
+        saved = sum(self._insert(rows[i:i + self.batch_size]) for i in range(0, len(rows), self.batch_size))
+        logger.debug(f"attendance flushed: {saved} of {len(rows)} check-ins")
+        return saved
+
+    def _insert(self, rows):
+        # a failed batch never fails the request that happened to flush it
+        try:
+            insert(rows)
+            return len(rows)
+        except IntegrityError:
+            # a meeting or profile deleted since its check-in was accepted, the rest go in one by one
+            saved = 0
+            for row in rows:
+                try:
+                    insert([row])
+                    saved += 1
+                except IntegrityError:
+                    logger.warning(f"check-in dropped: meeting {row.meeting_id}, profile {row.participant_id}")
+            return saved
+        except DatabaseError:
+            logger.exception(f"attendance flush failed, {len(rows)} check-ins kept")
+            with self.lock:
+                for row in rows:
+                    self.pending.setdefault((row.meeting_id, row.participant_id), row.checked_in_at)
+            return 0
+
+
+attendance = AttendanceBuffer(settings.ATTENDANCE_FLUSH_SECONDS, settings.ATTENDANCE_BATCH_SIZE)
@@ -1,72 +1,196 @@
+import calendar
 import datetime
 import logging
+import time
 from datetime import timedelta
 from functools import wraps
 
 import jwt
 from dateutil import parser
-from graphene_django.views import GraphQLView
+from django.conf import settings
+from django.http import HttpResponseBadRequest
+from django.utils.cache import cc_delim_re, patch_cache_control
+from graphene_django.views import GraphQLView, HttpError
+from graphql.execution import ExecutionResult
 
+from django_server.graphene.backend import persisted_queries
+from django_server.graphene.cache import get_document_max_age
+from django_server.graphene.cost import check_query_cost, get_query_cost
+from django_server.const import UserStatusEnum
 from django_server.graphene.exception import PermissionException
-from django_server.models import Profile
+from django_server.graphene.loader import clear
+from django_server.libs.activity import activity
+from django_server.libs.lru import LRUCache
+from django_server.libs.revocation import RevocationFilter
+from django_server.models import Profile, TokenRevocation
 from django_server.settings import SECRET_KEY
 
 TOKEN_VALID_DAYS = 365
+ACCESS_TOKEN_VALID_MINUTES = 15
+TOKEN_CACHE_SIZE = 4096
+
+ACCESS = 'access'
+REFRESH = 'refresh'
 
 logger = logging.getLogger(__name__)
 
+# access token -> (claims, expiry epoch) of tokens whose signature has been checked
+verified_tokens = LRUCache(TOKEN_CACHE_SIZE)
+revocations = RevocationFilter(timedelta(days=TOKEN_VALID_DAYS))
+
+
+def get_profile_from_claims(claims):
+    # a Profile without a query: fields other than the claims are deferred and load on access
+    values = {'id': claims['user_id'], 'role': claims['role'], 'status': claims['status']}
+    fields = [x.attname for x in Profile._meta.concrete_fields if x.attname in values]
+    return Profile.from_db('default', fields, [values[x] for x in fields])
+
+
+def authenticate(request):
+    # the profile of the request's access token, built from its claims and kept on the request
+    if hasattr(request, 'profile'):
+        return request.profile
+
+    profile = None
+    verified = AuthHelper.verify_token(request.META.get('HTTP_AUTHORIZATION'))
+    if verified:
+        claims, expires = verified
+        if not revocations.is_revoked(claims['user_id'], claims['issued']):
+            profile = get_profile_from_claims(claims)
+            logger.debug(f"Login successful {profile.id}")
+            setattr(request, 'user', profile)
+            setattr(request, 'expires', expires)
+
+    setattr(request, 'profile', profile)
+    return profile
+
 
 def authorization(func):
     @wraps(func)
     def wrap(root, info, **kwargs):
-        if not hasattr(info.context, 'user'):
+        user = getattr(info.context, 'user', None)
+        if not isinstance(user, Profile):
             raise PermissionException(message="Invalid auth token")
 
-        user = info.context.user
-        try:
-            user = Profile.objects.get(id=user.id)  # reload
-        except Profile.DoesNotExist:
+        if user.status != UserStatusEnum.ACTIVE.value:
             raise PermissionException(message="Invalid agent")
 
-        info.context.user = user
         return func(root, info, **kwargs)
 
     return wrap
 
 
+def strip_csrf_cookie(response):
+    # nginx neither stores a response that sets a cookie nor one that varies on it
+    response.cookies.pop(settings.CSRF_COOKIE_NAME, None)
+    if response.has_header('Vary'):
+        vary = [x for x in cc_delim_re.split(response['Vary']) if x.lower() != 'cookie']
+        if vary:
+            response['Vary'] = ', '.join(vary)
+        else:
+            del response['Vary']
+
+
 class TokenAuthGraphQLView(GraphQLView):
+    persisted = False
+    extensions = None
+
     def dispatch(self, request, *args, **kwargs):
-        auth_header = request.META.get('HTTP_AUTHORIZATION')
+        if authenticate(request):
+            activity.seen(request.profile.id)
+
+        response = super().dispatch(request, *args, **kwargs)
+
+        max_age = getattr(request, 'cache_max_age', 0)
+        if max_age and response.status_code == 200:
+            # nginx micro-caches these, so they must be the same for everyone
+            patch_cache_control(response, public=True, max_age=max_age)
+            strip_csrf_cookie(response)
+        return response
+
+    def parse_body(self, request):
+        # a JSON array is a batch of operations, run in order with the context of this one request
+        if self.get_content_type(request) == 'application/json':
+            self.batch = request.body.lstrip()[:1] == b'['
+
+        data = super().parse_body(request)
+        if self.batch and len(data) > settings.GRAPHQL_MAX_BATCH_SIZE:
+            raise HttpError(HttpResponseBadRequest(f"Too many operations: {len(data)}"))
+        return data
+
+    def json_encode(self, request, d, pretty=False):
+        # graphene-django 2 leaves the extensions of the execution result out of the response
+        extensions, self.extensions = self.extensions, None
+        if extensions and isinstance(d, dict):
+            d = dict(d, extensions=extensions)
+        return super().json_encode(request, d, pretty)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        cost = None
+        error = None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query) if query else None
+        except Exception:
+            # syntax errors are reported by graphene
+            document = None
+
+        if document:
+            # static analysis before execution; the cost is reported in extensions either way
+            cost = get_query_cost(self.schema, document.document_ast, operation_name,
+                                  variables if isinstance(variables, dict) else None)
+            spent = getattr(request, 'query_cost', 0)
+            error = check_query_cost(cost, getattr(request.user, 'role', None), spent)
+            if not error:
+                request.query_cost = spent + cost.cost
+
+        if error:
+            logger.warning(f"query rejected: {error.message}, {request.user}")
+            result = ExecutionResult(errors=[error], invalid=True)
+        else:
+            result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        if result and cost:
+            result.extensions['cost'] = cost.to_dict()
+        self.extensions = result.extensions if result else None
+
+        if self.batch and document and document.get_operation_type(operation_name) == 'mutation':
+            # later operations of the batch must not read rows loaded before the mutation
+            clear(request)
 
-        if auth_header:
-            ret = AuthHelper.decode_token(auth_header)[0]
-            if ret:
-                user_id = ret.get('user_id')
-                expires = ret.get('expires')
+        # only persisted queries sent with GET and no token are cacheable; the smallest hint of a batch wins
+        max_age = 0
+        anonymous = not request.META.get('HTTP_AUTHORIZATION')
+        if request.method == 'GET' and self.persisted and anonymous and result and not result.errors:
+            max_age = get_document_max_age(document, operation_name)
+        request.cache_max_age = min(getattr(request, 'cache_max_age', max_age), max_age)
 
-                try:
-                    profile = Profile.objects.get(id=user_id)
-                    logger.debug(f"Login successful {profile}")
-                    setattr(request, 'user', profile)
-                    setattr(request, 'expires', expires)
-                except Exception:
-                    pass
+        return result
 
-        return super().dispatch(request, *args, **kwargs)
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+
+        operation_id = request.GET.get('operationId') or data.get('operationId')
+        self.persisted = bool(operation_id and not query)
+        if self.persisted:
+            query = persisted_queries.get(operation_id)
+            if query is None:
+                raise HttpError(HttpResponseBadRequest(f"Unknown operationId: {operation_id}"))
+
+        return query, variables, operation_name, id
 
 
 class AuthHelper(object):
     @staticmethod
-    def _generate_token(payload):
+    def _generate_token(payload, valid_for):
         now = datetime.datetime.utcnow()
-        expire_at = now + timedelta(days=TOKEN_VALID_DAYS)
+        expire_at = now + valid_for
+        payload["issued"] = time.time()
         payload["expires"] = str(expire_at)
         token = jwt.encode(payload, SECRET_KEY, algorithm='HS256').decode('utf-8')
         return token
 
     @staticmethod
-    def generate_token(payload):
-        logger.debug(f"generate_token: payload={payload}")
+    def _get_profile(payload):
         user_id = payload.get('user_id')
 
         if not user_id:
@@ -74,12 +198,70 @@ class AuthHelper(object):
             return None
 
         try:
-            Profile.objects.get(id=user_id)
+            return Profile.objects.get(id=user_id)
         except Profile.DoesNotExist:
             logger.error("fail to generate token. NO User")
             return None
 
-        return AuthHelper._generate_token(payload)
+    @staticmethod
+    def generate_token(payload, profile=None):
+        # short-lived access token; the role and status claims spare the database on every request
+        logger.debug(f"generate_token: payload={payload}")
+        profile = profile or AuthHelper._get_profile(payload)
+        if not profile:
+            return None
+
+        payload = dict(payload, user_id=profile.id, role=profile.role, status=profile.status, type=ACCESS)
+        return AuthHelper._generate_token(payload, timedelta(minutes=ACCESS_TOKEN_VALID_MINUTES))
+
+    @staticmethod
+    def generate_refresh_token(payload, profile=None):
+        logger.debug(f"generate_refresh_token: payload={payload}")
+        profile = profile or AuthHelper._get_profile(payload)
+        if not profile:
+            return None
+
+        payload = dict(payload, user_id=profile.id, type=REFRESH)
+        return AuthHelper._generate_token(payload, timedelta(days=TOKEN_VALID_DAYS))
+
+    @staticmethod
+    def verify_token(token):
+        # (claims, expiry epoch) of a valid access token, the signature is checked once per token
+        if not token:
+            return None
+
+        verified = verified_tokens.get(token)
+        if verified is None:
+            result = AuthHelper.decode_token(token)[0]
+            try:
+                if result['type'] != ACCESS:
+                    return None
+                claims = {x: result[x] for x in ['user_id', 'role', 'status', 'issued']}
+                verified = (claims, calendar.timegm(parser.parse(result['expires']).timetuple()))
+            except Exception:
+                return None
+            verified_tokens.set(token, verified)
+
+        if verified[1] < time.time():
+            verified_tokens.pop(token)
+            return None
+        return verified
+
+    @staticmethod
+    def verify_refresh_token(token):
+        # the active profile of a refresh token; refreshing is rare enough to check the database
+        result = AuthHelper.decode_token(token)[0]
+        if not result or result.get('type') != REFRESH:
+            return None
+
+        profile = Profile.objects.filter(id=result.get('user_id'), status=UserStatusEnum.ACTIVE.value).first()
+        if not profile:
+            return None
+
+        issued_at = datetime.datetime.fromtimestamp(result.get('issued', 0))
+        if TokenRevocation.objects.filter(profile_id=profile.id, created_at__gte=issued_at).exists():
+            return None
+        return profile
 
     @staticmethod
     def decode_token(token):
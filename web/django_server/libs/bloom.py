@@ -0,0 +1,25 @@
+import hashlib
+import math
+
+
+class BloomFilter(object):
+    # set membership without false negatives; false positives at about error_rate up to capacity keys
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing: the i-th position is a + i * b
+        digest = hashlib.sha256(str(key).encode('utf-8')).digest()
+        a = int.from_bytes(digest[:8], 'big')
+        b = int.from_bytes(digest[8:16], 'big') | 1
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(key))
@@ -0,0 +1,139 @@
+import heapq
+import logging
+from collections import defaultdict, namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from django_server import const
+from django_server import models
+
+logger = logging.getLogger(__name__)
+
+# exclusion constraints created by migration 0025_exclusion_time_meeting
+EXCLUSION_ERRORS = {
+    'meeting_space_exclusion': (const.MannaError.DUPLICATED, "space duplicate time"),
+    'meeting_zoom_exclusion': (const.MannaError.ZOOM_DUPLICATED, "zoom duplicate time"),
+}
+
+RESOURCE_ERRORS = {
+    'space_id': (const.MannaError.DUPLICATED, "space duplicate time"),
+    'zoom_id': (const.MannaError.ZOOM_DUPLICATED, "zoom duplicate time"),
+}
+INVALID_TIME = (const.MannaError.INVALID_TIME, "invalid time")
+
+# idx is the position in the requested batch, None for meetings already stored
+Reservation = namedtuple('Reservation', 'idx meeting_id space_id zoom_id start_time end_time')
+
+
+def overlapping(meetings, start_time, end_time):
+    # half-open intervals: [start_time, end_time) so back-to-back meetings never collide
+    return meetings.filter(start_time__lt=end_time, end_time__gt=start_time)
+
+
+def get_conflict(exc):
+    diag = getattr(exc.__cause__, 'diag', None)
+    return EXCLUSION_ERRORS.get(getattr(diag, 'constraint_name', None))
+
+
+def save_meeting(meeting):
+    # the database rejects double bookings; returns (MannaError, message) of the violation or None
+    try:
+        with transaction.atomic():
+            meeting.save()
+    except IntegrityError as e:
+        conflict = get_conflict(e)
+        if not conflict:
+            raise
+        logger.debug(f"reservation conflict: {meeting}, {conflict[0]}")
+        return conflict
+
+    return None
+
+
+def bulk_save_meetings(meetings):
+    # all or nothing: one INSERT for the whole batch, returns (meetings in input order, conflict or None)
+    try:
+        with transaction.atomic():
+            return models.Meeting.objects.bulk_create(meetings), None
+    except IntegrityError as e:
+        conflict = get_conflict(e)
+        if not conflict:
+            raise
+        logger.debug(f"reservation conflict: {len(meetings)} meetings, {conflict[0]}")
+        return [], conflict
+
+
+def get_stored_reservations(reservations):
+    space_ids = {x.space_id for x in reservations if x.space_id}
+    zoom_ids = {x.zoom_id for x in reservations if x.zoom_id}
+    if not space_ids and not zoom_ids:
+        return []
+
+    meetings = models.Meeting.objects.filter(Q(space_id__in=space_ids) | Q(zoom_id__in=zoom_ids))
+    meetings = overlapping(meetings,
+                           min(x.start_time for x in reservations),
+                           max(x.end_time for x in reservations))
+    meetings = meetings.exclude(id__in=[x.meeting_id for x in reservations if x.meeting_id])
+
+    return [Reservation(None, meeting_id, space_id, zoom_id, to_naive(start_time), to_naive(end_time))
+            for meeting_id, space_id, zoom_id, start_time, end_time in
+            meetings.values_list('id', 'space_id', 'zoom_id', 'start_time', 'end_time')]
+
+
+def sweep(reservations):
+    # yields every overlapping pair of [start_time, end_time) intervals, ordered by start_time.
+    # an empty interval overlaps nothing, like the empty range in the exclusion constraints
+    active = []
+    reservations = [x for x in reservations if x.start_time < x.end_time]
+    for order, reservation in enumerate(sorted(reservations, key=lambda x: (x.start_time, x.end_time))):
+        while active and active[0][0] <= reservation.start_time:
+            heapq.heappop(active)
+
+        for _, _, other in active:
+            yield other, reservation
+
+        heapq.heappush(active, (reservation.end_time, order, reservation))
+
+
+def to_naive(value):
+    # stored times come back naive (USE_TZ = False) while graphene parses offsets from the client
+    if value is not None and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def find_conflicts(reservations):
+    # checks a batch against the stored meetings and against itself in one query.
+    # returns {idx: (MannaError, message)}; when two requested items collide the later one is reported.
+    conflicts = {}
+    valid = []
+    for reservation in reservations:
+        reservation = reservation._replace(start_time=to_naive(reservation.start_time),
+                                           end_time=to_naive(reservation.end_time))
+        if reservation.start_time is None or reservation.end_time is None \
+                or reservation.start_time > reservation.end_time:
+            conflicts[reservation.idx] = INVALID_TIME
+        else:
+            valid.append(reservation)
+
+    if not valid:
+        return conflicts
+
+    stored = get_stored_reservations(valid)
+    for resource in ['zoom_id', 'space_id']:
+        timelines = defaultdict(list)
+        for reservation in valid + stored:
+            if getattr(reservation, resource):
+                timelines[getattr(reservation, resource)].append(reservation)
+
+        for timeline in timelines.values():
+            for a, b in sweep(timeline):
+                if a.idx is None and b.idx is None:
+                    continue
+                idx = b.idx if a.idx is None else a.idx if b.idx is None else max(a.idx, b.idx)
+                # space conflicts take precedence over zoom conflicts, as in the single checks
+                conflicts[idx] = RESOURCE_ERRORS[resource]
+
+    return conflicts
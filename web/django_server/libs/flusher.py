@@ -0,0 +1,44 @@
+import logging
+import threading
+import time
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher(object):
+    # flushes write-behind buffers once their interval has passed, so rows do not wait in memory for
+    # a later request of the same worker. one daemon thread per worker, started after the fork
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.tick = min(x.interval for x in buffers)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='flusher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.tick):
+            self.flush_due()
+
+    def flush_due(self):
+        flushed = 0
+        for buffer in self.buffers:
+            if time.time() - buffer.flushed_at < buffer.interval:
+                continue
+            try:
+                flushed += buffer.flush()
+            except Exception:
+                logger.exception(f"{type(buffer).__name__} flush failed")
+
+        # the connection is only opened when there was something to write and is not kept, so it does
+        # not count against the request threads' share of DB_POOL_SIZE
+        if connection.connection is not None:
+            connection.close()
+        return flushed
@@ -0,0 +1,68 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class HashingPool(object):
+    # password hashes are verified by a few workers; past `queue` waiting checks new ones are refused
+    # so a burst of logins cannot pin every request thread on PBKDF2
+    def __init__(self, workers, queue):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+
+        try:
+            # only the hasher runs off-thread, it never touches the database
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def check_password(self, user, password):
+        # User.check_password with the hashing off-thread; an outdated hash is upgraded on this thread
+        rehash = []
+        if not self.run(check_password, password, user.password, rehash.append):
+            return False
+
+        if rehash:
+            user.set_password(password)
+            user._password = None
+            user.save(update_fields=['password'])
+        return True
+
+
+hashing_pool = HashingPool(settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE)
+
+
+class HashingPoolBackend(ModelBackend):
+    # ModelBackend hashing on the pool, so authenticate() keeps its signals; raises HashingBusy
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, unknown users take as long as wrong passwords
+            hashing_pool.run(make_password, password)
+            return None
+
+        if hashing_pool.check_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,91 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+from django_server.libs.authentification import authenticate
+
+logger = logging.getLogger(__name__)
+
+
+class MiddlewareChain(object):
+    # one middleware stack, built the way django's BaseHandler.load_middleware builds MIDDLEWARE
+    def __init__(self, middleware_paths, get_response):
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+
+        handler = convert_exception_to_response(get_response)
+        for middleware_path in reversed(middleware_paths):
+            middleware = import_string(middleware_path)
+            try:
+                instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+
+            if instance is None:
+                raise ImproperlyConfigured(f"Middleware factory {middleware_path} returned None.")
+
+            if hasattr(instance, 'process_view'):
+                self.view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, 'process_template_response'):
+                self.template_response_middleware.append(instance.process_template_response)
+            if hasattr(instance, 'process_exception'):
+                self.exception_middleware.append(instance.process_exception)
+
+            handler = convert_exception_to_response(instance)
+        self.handler = handler
+
+    def __call__(self, request):
+        return self.handler(request)
+
+
+class PathMiddlewareRouter(object):
+    # the only entry in MIDDLEWARE: a request runs through the chain of the first MIDDLEWARE_ROUTES
+    # prefix its path starts with, so the token API skips sessions, csrf, messages and django auth
+    def __init__(self, get_response):
+        self.routes = [(prefix, MiddlewareChain(paths, get_response)) for prefix, paths in settings.MIDDLEWARE_ROUTES]
+
+    def route(self, path):
+        for prefix, chain in self.routes:
+            if path.startswith(prefix):
+                return chain
+        raise ImproperlyConfigured(f"No middleware route for {path}")
+
+    def __call__(self, request):
+        request.middleware_chain = self.route(request.path_info)
+        return request.middleware_chain(request)
+
+    # django calls these hooks on MIDDLEWARE entries only, they are passed on to the routed chain
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for process_view in request.middleware_chain.view_middleware:
+            response = process_view(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        for process_template_response in request.middleware_chain.template_response_middleware:
+            response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        for process_exception in request.middleware_chain.exception_middleware:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
+class TokenAuthMiddleware(object):
+    # request.user and request.profile from the Authorization header, in place of sessions and django auth
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # without a valid token the request is anonymous, as under django's AuthenticationMiddleware
+        request.user = authenticate(request) or AnonymousUser()
+        return self.get_response(request)
@@ -0,0 +1,28 @@
+import logging
+import time
+
+from django.db import connections
+
+from django_server.graphene.backend import document_backend, persisted_queries
+from django_server.graphene.program import program_tags
+from django_server.schema import schema
+
+logger = logging.getLogger(__name__)
+
+
+def preload():
+    # the work each worker would otherwise repeat on its first requests, done once before forking
+    started = time.time()
+
+    # builds every type of the schema
+    schema.introspect()
+
+    # parsed and validated documents of the persisted queries
+    for query in persisted_queries.queries.values():
+        document_backend.document_from_string(schema, query)
+
+    program_tags.load()
+
+    # connections must not be shared with the forked workers
+    connections.close_all()
+    logger.info(f"preloaded in {time.time() - started:.2f}s")
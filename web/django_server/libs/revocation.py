@@ -0,0 +1,44 @@
+import datetime
+import logging
+import threading
+import time
+
+from django_server.libs.bloom import BloomFilter
+from django_server.models import TokenRevocation
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_REFRESH_SECONDS = 10
+REVOCATION_CAPACITY = 1024
+
+
+class RevocationFilter(object):
+    # profile ids with revoked tokens, rebuilt from TokenRevocation every REVOCATION_REFRESH_SECONDS.
+    # a miss needs no query; a hit, possibly false, is confirmed against the table.
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.bloom = None
+        self.built_at = 0
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        since = datetime.datetime.now() - self.max_age
+        profile_ids = set(TokenRevocation.objects.filter(created_at__gte=since).values_list('profile_id', flat=True))
+
+        bloom = BloomFilter(max(len(profile_ids) * 2, REVOCATION_CAPACITY))
+        for profile_id in profile_ids:
+            bloom.add(profile_id)
+
+        with self.lock:
+            self.bloom = bloom
+            self.built_at = time.time()
+        logger.debug(f"revocation filter rebuilt: {len(profile_ids)} profiles")
+
+    def is_revoked(self, profile_id, issued):
+        if self.bloom is None or time.time() - self.built_at > REVOCATION_REFRESH_SECONDS:
+            self.rebuild()
+
+        if profile_id not in self.bloom:
+            return False
+        return TokenRevocation.objects.filter(profile_id=profile_id,
+                                              created_at__gte=datetime.datetime.fromtimestamp(issued)).exists()
@@ -0,0 +1,42 @@
+import logging
+import threading
+import time
+
+from django.db.models.signals import post_delete, post_save
+
+logger = logging.getLogger(__name__)
+
+
+class TableSnapshot(object):
+    # the rows of a small, rarely changed queryset kept in memory and reloaded every `max_age` seconds.
+    # loaded before the server forks, the rows are shared by every worker.
+    # a save or delete of the model reloads the snapshot of the process that made it; other workers
+    # (and queryset update()s) catch up within `max_age`, which is why it is no longer than the cache hint.
+    def __init__(self, queryset, max_age):
+        self.queryset = queryset
+        self.max_age = max_age
+        self.rows = None
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+        for signal in [post_save, post_delete]:
+            signal.connect(self.changed, sender=queryset.model, weak=False)
+
+    def changed(self, **kwargs):
+        self.clear()
+
+    def load(self):
+        rows = list(self.queryset.all())
+        with self.lock:
+            self.rows = rows
+            self.loaded_at = time.time()
+        logger.debug(f"{self.queryset.model.__name__} snapshot loaded: {len(rows)} rows")
+        return rows
+
+    def clear(self):
+        with self.lock:
+            self.rows = None
+
+    def all(self):
+        if self.rows is None or time.time() - self.loaded_at > self.max_age:
+            return self.load()
+        return self.rows
@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from django_server.libs.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBucketStore(object):
+    # buckets of this process only, the least recently used beyond maxsize are dropped so rotating
+    # emails cannot grow the worker without bound
+    def __init__(self, maxsize=None):
+        self._buckets = LRUCache(maxsize or settings.LOGIN_THROTTLE_LOCAL_SIZE)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            allowed, bucket = refill(self._buckets.get(key), rate, burst, now)
+            self._buckets.set(key, bucket)
+            return allowed
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore(object):
+    # buckets shared by every worker through the django cache; concurrent takes may race, which
+    # at worst lets a few extra attempts through
+    def __init__(self, prefix='throttle:'):
+        self.prefix = prefix
+
+    def take(self, key, rate, burst, now):
+        allowed, bucket = refill(cache.get(self.prefix + key), rate, burst, now)
+        cache.set(self.prefix + key, bucket, int(burst / rate) + 1)
+        return allowed
+
+
+def refill(bucket, rate, burst, now):
+    # token bucket: `burst` tokens, refilled at `rate` per second, one taken per attempt
+    tokens, updated_at = bucket or (burst, now)
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    if tokens < 1:
+        return False, (tokens, now)
+    return True, (tokens - 1, now)
+
+
+class Throttle(object):
+    def __init__(self, rate, burst, store, prefix=''):
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+        self.prefix = prefix
+
+    def allow(self, key):
+        if key is None:
+            return True
+        return self.store.take(self.prefix + key, self.rate, self.burst, time.time())
+
+
+def get_client_ip(request):
+    # nginx passes the client address in X-Real-IP
+    meta = getattr(request, 'META', {})
+    return meta.get('HTTP_X_REAL_IP') or meta.get('REMOTE_ADDR')
+
+
+login_store = import_string(settings.LOGIN_THROTTLE_STORE)()
+email_throttle = Throttle(*settings.LOGIN_THROTTLE_EMAIL, login_store, prefix='email:')
+ip_throttle = Throttle(*settings.LOGIN_THROTTLE_IP, login_store, prefix='ip:')
+
+
+def allow_signin(request, email):
+    # both buckets are charged, so rotating emails is still limited by address
+    allowed = email_throttle.allow(email.lower())
+    return ip_throttle.allow(get_client_ip(request)) and allowed
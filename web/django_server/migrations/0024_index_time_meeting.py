@@ -0,0 +1,21 @@
+# Generated by Django 2.2.13 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0023_order_create_at_program_participant'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['space', 'start_time', 'end_time'], name='meeting_space_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['zoom', 'start_time', 'end_time'], name='meeting_zoom_time_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# GiST range equality on a single-point int4range behaves like `space_id WITH =` from btree_gist,
+# without requiring an extension (and a superuser) on the database.
+SPACE_EXCLUSION = """
+ALTER TABLE django_server_meeting ADD CONSTRAINT meeting_space_exclusion
+EXCLUDE USING gist (int4range(space_id, space_id, '[]') WITH =, tstzrange(start_time, end_time) WITH &&)
+WHERE (space_id IS NOT NULL)
+"""
+
+ZOOM_EXCLUSION = """
+ALTER TABLE django_server_meeting ADD CONSTRAINT meeting_zoom_exclusion
+EXCLUDE USING gist (int4range(zoom_id, zoom_id, '[]') WITH =, tstzrange(start_time, end_time) WITH &&)
+WHERE (zoom_id IS NOT NULL)
+"""
+
+# pairs of meetings that already overlap in the same space or zoom and would make the constraints fail
+OVERLAPS = """
+SELECT '{column}', a.{column}, a.id, a.start_time, a.end_time, b.id, b.start_time, b.end_time
+FROM django_server_meeting AS a
+JOIN django_server_meeting AS b
+    ON a.{column} = b.{column} AND a.id < b.id
+    AND tstzrange(a.start_time, a.end_time) && tstzrange(b.start_time, b.end_time)
+ORDER BY a.{column}, a.start_time
+"""
+
+
+def check_overlaps(apps, schema_editor):
+    rows = []
+    with schema_editor.connection.cursor() as cursor:
+        for column in ['space_id', 'zoom_id']:
+            cursor.execute(OVERLAPS.format(column=column))
+            rows += cursor.fetchall()
+
+    if rows:
+        lines = [f"  {column}={resource}: meeting {a} ({a_start} - {a_end}) overlaps meeting {b} ({b_start} - {b_end})"
+                 for column, resource, a, a_start, a_end, b, b_start, b_end in rows]
+        raise RuntimeError("overlapping meetings must be moved or deleted before the exclusion constraints "
+                           "can be added:\n" + "\n".join(lines))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0024_index_time_meeting'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_overlaps, reverse_code=migrations.RunPython.noop),
+        migrations.RunSQL(
+            SPACE_EXCLUSION,
+            reverse_sql='ALTER TABLE django_server_meeting DROP CONSTRAINT meeting_space_exclusion',
+        ),
+        migrations.RunSQL(
+            ZOOM_EXCLUSION,
+            reverse_sql='ALTER TABLE django_server_meeting DROP CONSTRAINT meeting_zoom_exclusion',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.13 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0025_exclusion_time_meeting'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='meeting',
+            options={'ordering': ['start_time', 'id']},
+        ),
+        migrations.AlterModelOptions(
+            name='program',
+            options={'ordering': ['-modified_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['start_time', 'id'], name='meeting_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['program', 'start_time', 'id'], name='meeting_program_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='program',
+            index=models.Index(fields=['state', '-modified_at', '-id'], name='program_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.13 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0026_keyset_ordering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenRevocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('profile_id', models.IntegerField(db_index=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
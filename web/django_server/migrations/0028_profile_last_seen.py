@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0027_token_revocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='last_seen',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
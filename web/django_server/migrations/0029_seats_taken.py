@@ -0,0 +1,37 @@
+# Generated by Django 2.2.13 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+# counters of the participants stored so far
+PROGRAM_SEATS = """
+UPDATE django_server_program AS p SET seats_taken = (
+    SELECT count(*) FROM django_server_programparticipant AS pp WHERE pp.program_id = p.id
+)
+"""
+
+MEETING_SEATS = """
+UPDATE django_server_meeting AS m SET seats_taken = (
+    SELECT count(*) FROM django_server_meetingparticipant AS mp WHERE mp.meeting_id = m.id
+)
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0028_profile_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='seats_taken',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='seats_taken',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(PROGRAM_SEATS, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(MEETING_SEATS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.13 on 2026-10-18 14:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0029_seats_taken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramWaiter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='program_waiter', to='django_server.Profile')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='program_waiter', to='django_server.Program')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MeetingWaiter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('meeting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meeting_waiter', to='django_server.Meeting')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meeting_waiter', to='django_server.Profile')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='programwaiter',
+            index=models.Index(fields=['program', 'created_at', 'id'], name='program_waiter_fifo_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='programwaiter',
+            constraint=models.UniqueConstraint(fields=('program', 'participant'), name='program_waiter_constraint'),
+        ),
+        migrations.AddIndex(
+            model_name='meetingwaiter',
+            index=models.Index(fields=['meeting', 'created_at', 'id'], name='meeting_waiter_fifo_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='meetingwaiter',
+            constraint=models.UniqueConstraint(fields=('meeting', 'participant'), name='meeting_waiter_constraint'),
+        ),
+    ]
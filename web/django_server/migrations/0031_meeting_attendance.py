@@ -0,0 +1,29 @@
+# Generated by Django 2.2.13 on 2026-10-18 14:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_server', '0030_waiter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeetingAttendance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('checked_in_at', models.DateTimeField()),
+                ('meeting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meeting_attendance', to='django_server.Meeting')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meeting_attendance', to='django_server.Profile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='meetingattendance',
+            constraint=models.UniqueConstraint(fields=('meeting', 'participant'), name='meeting_attendance_constraint'),
+        ),
+    ]
@@ -1,10 +1,19 @@
-from django.contrib.auth.models import User
 import random
-from django.db import models
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 from django_server.const import ManClassEnum, SpaceStateEnum, ProgramStateEnum, UserStatusEnum, ProgramTagTypeEnum
 
 
+class NoSeatLeft(Exception):
+    pass
+
+
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
@@ -13,16 +22,72 @@ class BaseModel(models.Model):
         abstract = True
 
 
+class ProfileQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # the claims of issued tokens go stale along with the status or role
+        if 'status' not in kwargs and 'role' not in kwargs:
+            return super().update(**kwargs)
+
+        with transaction.atomic():
+            profile_ids = list(self.values_list('id', flat=True))
+            TokenRevocation.objects.bulk_create([TokenRevocation(profile_id=x) for x in profile_ids])
+            return super().update(**kwargs)
+
+
 class Profile(BaseModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=32, blank=True)
     status = models.CharField(max_length=1, default=UserStatusEnum.ACTIVE.value)
     last_signin = models.DateTimeField(null=True)
+    last_seen = models.DateTimeField(null=True)
     role = models.CharField(max_length=1, default=ManClassEnum.MEMBER.value)
 
+    objects = ProfileQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.user.username}, {self.name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_claims = instance.get_claims()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.loaded_claims = self.get_claims()
+
+    def get_claims(self):
+        # the status and role carried by tokens, None where the field is deferred
+        return tuple(self.__dict__.get(x) for x in ['status', 'role'])
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'status', 'role'} & set(update_fields):
+            return
+
+        # tokens carry the status and role, so they stop working once either changes
+        claims = self.get_claims()
+        loaded = getattr(self, 'loaded_claims', claims)
+        if any(old is not None and old != new for old, new in zip(loaded, claims)):
+            TokenRevocation.objects.create(profile_id=self.id)
+        self.loaded_claims = claims
+
+
+@receiver(post_delete, sender=Profile)
+def revoke_deleted_profile(sender, instance, **kwargs):
+    # also sent for profiles deleted by a cascade from their User or by a queryset delete()
+    TokenRevocation.objects.create(profile_id=instance.id)
+
+
+class TokenRevocation(BaseModel):
+    # tokens of the profile issued before created_at are invalid; no foreign key so deletions stay revoked
+    profile_id = models.IntegerField(db_index=True)
+
+    def __str__(self):
+        return f'{self.profile_id}, {self.created_at}'
+
 
 class Building(BaseModel):
     name = models.CharField(max_length=128)
@@ -88,13 +153,32 @@ class Program(BaseModel):
     required_man_class = models.CharField(max_length=1, default=ManClassEnum.NON_MEMBER.value)
     tag = models.ForeignKey(ProgramTag, on_delete=models.SET_NULL, null=True)
     image_no = models.IntegerField(default=get_default_no)
+    # ProgramParticipant rows, kept by claim_seat / release_seat
+    seats_taken = models.IntegerField(default=0)
 
     class Meta:
-        ordering = ['-modified_at']
+        ordering = ['-modified_at', '-id']
+        indexes = [
+            models.Index(fields=['state', '-modified_at', '-id'], name='program_keyset_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.required_man_class}, {self.state}'
 
+    def claim_seat(self):
+        # a single conditional update: no count, and concurrent claims never go past participants_max
+        return claim_seat(self, f"""
+            UPDATE {Program._meta.db_table} SET seats_taken = seats_taken + 1
+            WHERE id = %s AND seats_taken < participants_max
+            RETURNING seats_taken
+        """)
+
+    def release_seat(self):
+        return release_seat(self)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **without_counter(self, kwargs))
+
 
 class Meeting(BaseModel):
     name = models.CharField(max_length=128)
@@ -103,13 +187,62 @@ class Meeting(BaseModel):
     zoom = models.ForeignKey(Zoom, on_delete=models.SET_NULL, null=True)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
+    # MeetingParticipant rows, limited by the program's participants_max
+    seats_taken = models.IntegerField(default=0)
 
     class Meta:
-        ordering = ['created_at']
+        ordering = ['start_time', 'id']
+        indexes = [
+            models.Index(fields=['space', 'start_time', 'end_time'], name='meeting_space_time_idx'),
+            models.Index(fields=['zoom', 'start_time', 'end_time'], name='meeting_zoom_time_idx'),
+            models.Index(fields=['start_time', 'id'], name='meeting_keyset_idx'),
+            models.Index(fields=['program', 'start_time', 'id'], name='meeting_program_keyset_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name}, ({self.program})'
 
+    def claim_seat(self):
+        return claim_seat(self, f"""
+            UPDATE {Meeting._meta.db_table} AS m SET seats_taken = m.seats_taken + 1
+            FROM {Program._meta.db_table} AS p
+            WHERE m.id = %s AND p.id = m.program_id AND m.seats_taken < p.participants_max
+            RETURNING m.seats_taken
+        """)
+
+    def release_seat(self):
+        return release_seat(self)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **without_counter(self, kwargs))
+
+
+def without_counter(obj, kwargs):
+    # seats_taken only moves by claim_seat / release_seat, an update must not write back the count
+    # it happened to load. the loaded fields are saved the way django picks them for deferred models
+    if obj._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return kwargs
+
+    deferred = obj.get_deferred_fields()
+    fields = [x.attname for x in obj._meta.concrete_fields
+              if not x.primary_key and x.attname not in deferred and x.name != 'seats_taken']
+    return dict(kwargs, update_fields=fields)
+
+
+def claim_seat(obj, sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [obj.id])
+        row = cursor.fetchone()
+
+    if row is None:
+        return False
+    obj.seats_taken = row[0]
+    return True
+
+
+def release_seat(obj):
+    return type(obj).objects.filter(id=obj.id, seats_taken__gt=0).update(seats_taken=F('seats_taken') - 1) == 1
+
 
 class ProgramParticipant(BaseModel):
     program = models.ForeignKey(Program, related_name='program_participant', on_delete=models.CASCADE)
@@ -121,6 +254,22 @@ class ProgramParticipant(BaseModel):
             models.UniqueConstraint(fields=['program', 'participant'], name='program_participant_constraint')
         ]
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            # a new participant takes a seat, the claim is rolled back if the insert fails
+            if self._state.adding and not self.program.claim_seat():
+                raise NoSeatLeft()
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted, rows = super().delete(*args, **kwargs)
+            # the seat goes back only if this delete removed the row, not a concurrent one
+            if deleted:
+                self.program.release_seat()
+                promote(ProgramWaiter, ProgramParticipant, program=self.program)
+            return deleted, rows
+
 
 class MeetingParticipant(BaseModel):
     meeting = models.ForeignKey(Meeting, related_name='meeting_participant', on_delete=models.CASCADE)
@@ -130,3 +279,134 @@ class MeetingParticipant(BaseModel):
         constraints = [
             models.UniqueConstraint(fields=['meeting', 'participant'], name='meeting_participant_constraint')
         ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if self._state.adding and not self.meeting.claim_seat():
+                raise NoSeatLeft()
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted, rows = super().delete(*args, **kwargs)
+            if deleted:
+                self.meeting.release_seat()
+                promote(MeetingWaiter, MeetingParticipant, meeting=self.meeting)
+            return deleted, rows
+
+
+class ProgramWaiter(BaseModel):
+    program = models.ForeignKey(Program, related_name='program_waiter', on_delete=models.CASCADE)
+    participant = models.ForeignKey(Profile, related_name='program_waiter', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['program', 'created_at', 'id'], name='program_waiter_fifo_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['program', 'participant'], name='program_waiter_constraint')
+        ]
+
+
+class MeetingWaiter(BaseModel):
+    meeting = models.ForeignKey(Meeting, related_name='meeting_waiter', on_delete=models.CASCADE)
+    participant = models.ForeignKey(Profile, related_name='meeting_waiter', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['meeting', 'created_at', 'id'], name='meeting_waiter_fifo_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['meeting', 'participant'], name='meeting_waiter_constraint')
+        ]
+
+
+class MeetingAttendance(BaseModel):
+    meeting = models.ForeignKey(Meeting, related_name='meeting_attendance', on_delete=models.CASCADE)
+    participant = models.ForeignKey(Profile, related_name='meeting_attendance', on_delete=models.CASCADE)
+    checked_in_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['meeting', 'participant'], name='meeting_attendance_constraint')
+        ]
+
+
+def promote(waiter_model, participant_model, **parent):
+    # the longest waiting profile takes the freed seat. locked waiters are skipped, so concurrent leaves
+    # promote different profiles instead of queueing behind each other.
+    while True:
+        waiter = waiter_model.objects.select_for_update(skip_locked=True).filter(**parent).first()
+        if waiter is None:
+            return None
+
+        try:
+            participant = participant_model.objects.create(participant_id=waiter.participant_id, **parent)
+        except NoSeatLeft:
+            return None
+        except IntegrityError:
+            # joined on their own while waiting
+            participant = None
+
+        waiter.delete()
+        if participant is not None:
+            return participant
+
+
+def fill_seats(program, seats):
+    # promotes up to `seats` waiters of the program and of each of its meetings
+    for _ in range(seats):
+        if promote(ProgramWaiter, ProgramParticipant, program=program) is None:
+            break
+
+    for meeting in Meeting.objects.filter(program=program, meeting_waiter__isnull=False).distinct():
+        for _ in range(seats):
+            if promote(MeetingWaiter, MeetingParticipant, meeting=meeting) is None:
+                break
+
+
+def enroll_participants(program, profile_ids):
+    # as many of profile_ids as there are seats, in order, with the capacity checked once under the program's
+    # row lock. returns the enrolled ids and those already participating, the others found no seat.
+    with transaction.atomic():
+        seats_taken, participants_max = Program.objects.select_for_update().filter(id=program.id) \
+            .values_list('seats_taken', 'participants_max').get()
+        existing = set(ProgramParticipant.objects.filter(program=program, participant_id__in=profile_ids)
+                       .values_list('participant_id', flat=True))
+
+        candidates = [x for x in dict.fromkeys(profile_ids) if x not in existing]
+        enrolled = candidates[:max(0, participants_max - seats_taken)]
+        if enrolled:
+            ProgramParticipant.objects.bulk_create([ProgramParticipant(program=program, participant_id=x)
+                                                    for x in enrolled], ignore_conflicts=True)
+            Program.objects.filter(id=program.id).update(seats_taken=F('seats_taken') + len(enrolled))
+        if enrolled or existing:
+            # participants do not wait any more
+            ProgramWaiter.objects.filter(program=program, participant_id__in=enrolled + list(existing)).delete()
+
+    program.seats_taken = seats_taken + len(enrolled)
+    return enrolled, existing
+
+
+def remove_participants(program, profile_ids):
+    # returns the removed ids, their seats go to the first waiters
+    with transaction.atomic():
+        removed = list(ProgramParticipant.objects.select_for_update()
+                       .filter(program=program, participant_id__in=profile_ids).values_list('participant_id', flat=True))
+        if not removed:
+            return removed
+
+        ProgramParticipant.objects.filter(program=program, participant_id__in=removed).delete()
+        Program.objects.filter(id=program.id).update(seats_taken=Greatest(F('seats_taken') - len(removed), 0))
+
+        waiters = list(ProgramWaiter.objects.select_for_update(skip_locked=True).filter(program=program)
+                       .values_list('participant_id', flat=True)[:len(removed)])
+        if waiters:
+            enroll_participants(program, waiters)
+        else:
+            program.refresh_from_db(fields=['seats_taken'])
+
+    return removed
+
@@ -0,0 +1,47 @@
+import timeit
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.views.decorators.csrf import csrf_exempt
+
+from django_server.libs.authentification import AuthHelper
+from django_server.libs.middleware import MiddlewareChain
+from django_server.models import Profile
+
+
+@csrf_exempt
+def view(request):
+    return HttpResponse('{}', content_type='application/json')
+
+
+def bench(name, middleware_paths, request_factory, number):
+    chain = MiddlewareChain(middleware_paths, view)
+
+    def call():
+        request = request_factory()
+        # what django does between the middleware and the view
+        for process_view in chain.view_middleware:
+            process_view(request, view, (), {})
+        chain(request)
+
+    call()
+    seconds = min(timeit.repeat(call, number=number, repeat=5))
+    print(f"{name:10} {len(middleware_paths)} middleware  {seconds / number * 1e6:8.1f} us/request")
+    return seconds / number
+
+
+def run(*args):
+    # python manage.py runscript bench_middleware [--script-args=<requests>]
+    number = int(args[0]) if args else 2000
+
+    profile = Profile.objects.first()
+    headers = {'HTTP_AUTHORIZATION': AuthHelper.generate_token({'user_id': profile.id}, profile)} if profile else {}
+    factory = RequestFactory()
+
+    def request_factory():
+        return factory.post('/graphql/', '{"query": "{ me { name } }"}', content_type='application/json', **headers)
+
+    full = bench('default', settings.DEFAULT_MIDDLEWARE, request_factory, number)
+    graphql = bench('graphql', settings.GRAPHQL_MIDDLEWARE, request_factory, number)
+    print(f"saved      {(full - graphql) * 1e6:8.1f} us/request")
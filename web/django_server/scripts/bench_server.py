@@ -0,0 +1,39 @@
+import threading
+import time
+import urllib.request
+
+
+def run(*args):
+    # python manage.py runscript bench_server --script-args <url> <concurrency> <seconds>
+    url = args[0] if args else 'http://127.0.0.1:8000/graphql/?operationId=AllPrograms'
+    concurrency = int(args[1]) if len(args) > 1 else 16
+    seconds = float(args[2]) if len(args) > 2 else 10
+
+    counts = {'ok': 0, 'error': 0}
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def client():
+        while time.time() < deadline:
+            started = time.time()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    response.read()
+                key = 'ok'
+            except Exception:
+                key = 'error'
+            with lock:
+                counts[key] += 1
+                latencies.append(time.time() - started)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(f"{counts['ok'] / seconds:8.1f} req/s  {counts['error']} errors  p50 {p50:.1f} ms  p99 {p99:.1f} ms")
@@ -50,7 +50,40 @@ GRAPHENE = {
     'SCHEMA': 'django_server.schema.schema',
 }
 
-MIDDLEWARE = [
+# parsed and validated query documents kept in memory, per process
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+# operation id -> query, clients may send {"operationId": ...} instead of the query
+GRAPHQL_PERSISTED_QUERIES = os.path.join(BASE_DIR, 'persisted_queries.json')
+# operations accepted in one batched request, i.e. a JSON array body
+GRAPHQL_MAX_BATCH_SIZE = 10
+# authenticate() hashes passwords on PASSWORD_HASHING_WORKERS threads, at most PASSWORD_HASHING_QUEUE more may wait
+PASSWORD_HASHING_WORKERS = 4
+PASSWORD_HASHING_QUEUE = 16
+AUTHENTICATION_BACKENDS = ['django_server.libs.hashing.HashingPoolBackend']
+# token buckets of signin attempts by email and by client address: (refill per second, burst)
+LOGIN_THROTTLE_EMAIL = (1 / 60, 5)
+LOGIN_THROTTLE_IP = (1 / 6, 20)
+# LocalBucketStore keeps the buckets per process, CacheBucketStore shares them through the django cache
+LOGIN_THROTTLE_STORE = 'django_server.libs.throttle.LocalBucketStore'
+# buckets kept by each process with LocalBucketStore
+LOGIN_THROTTLE_LOCAL_SIZE = 10000
+# signin and last-seen times are buffered and written to the profiles at most this often
+ACTIVITY_FLUSH_SECONDS = 5
+# meeting check-ins are buffered and inserted every ATTENDANCE_FLUSH_SECONDS or ATTENDANCE_BATCH_SIZE rows
+ATTENDANCE_FLUSH_SECONDS = 2
+ATTENDANCE_BATCH_SIZE = 500
+# rows assumed for lists and connections without first/last when costing a query
+GRAPHQL_DEFAULT_PAGE_SIZE = 100
+# (max depth, max cost) of a query by ManClassEnum value, None for clients without a token
+GRAPHQL_QUERY_LIMITS = {
+    None: (6, 2000),
+    'g': (6, 2000),
+    'n': (6, 2000),
+    'm': (8, 10000),
+    'a': (10, 50000),
+}
+
+DEFAULT_MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,6 +94,26 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# the token authenticated API uses none of sessions, csrf, messages, framing or django auth
+GRAPHQL_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django_server.libs.middleware.TokenAuthMiddleware',
+]
+
+# middleware chains by path prefix, the first match wins
+MIDDLEWARE_ROUTES = [
+    ('/graphql/', GRAPHQL_MIDDLEWARE),
+    ('/', DEFAULT_MIDDLEWARE),
+]
+
+MIDDLEWARE = [
+    'django_server.libs.middleware.PathMiddlewareRouter',
+]
+
+# admin looks for its middleware in MIDDLEWARE, the router runs them from DEFAULT_MIDDLEWARE
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'django_server.urls'
 
 TEMPLATES = [
@@ -109,6 +162,8 @@ DATABASES = {
         'PASSWORD': os.environ['DB_PASS'],
         'HOST': os.environ['DB_SERVICE'],
         'PORT': os.environ['DB_PORT'],
+        # each server thread keeps its connection between requests, see DB_POOL_SIZE in gunicorn.conf.py
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
         'OPTIONS': {
             'application_name': os.environ.get('DB_APPNAME', 'django')
         }
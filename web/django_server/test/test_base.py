@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from django.test import TestCase
 
 from django_server.const import SpaceStateEnum, ManClassEnum, ProgramStateEnum, ProgramTagTypeEnum
+from django_server.graphene.program import program_tags
 from django_server.models import Profile, Building, Space, Program, Meeting, ProgramTag, Zoom
 from django_server.schema import schema
 
@@ -25,6 +26,7 @@ class BaseTestCase(TestCase):
 
     def setUp(self):
         self.clean_db()
+        program_tags.clear()
         self.user = self.create_user(username='TestAdmin',
                                      email='test_admin@test.ai')
 
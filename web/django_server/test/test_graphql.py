@@ -0,0 +1,344 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from unittest import mock
+
+import jwt
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from freezegun import freeze_time
+from graphql.language.base import parse
+
+from django_server.graphene.backend import CachedDocumentBackend, document_backend, persisted_queries
+from django_server.graphene.cache import get_max_age
+from django_server.graphene.cost import get_query_cost
+from django_server.graphene.program import program_tags
+from django_server.const import ManClassEnum, MannaError, UserStatusEnum
+from django_server.libs.activity import activity
+from django_server.libs.authentification import TOKEN_VALID_DAYS, AuthHelper, revocations, verified_tokens
+from django_server.libs.bloom import BloomFilter
+from django_server.libs.preload import preload
+from django_server.models import Profile, ProgramTag, TokenRevocation
+from django_server.schema import schema
+from django_server.test.test_base import BaseTestCase, Context
+
+logger = logging.getLogger(__name__)
+
+
+class GraphQLViewTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client(HTTP_AUTHORIZATION=AuthHelper.generate_token({'user_id': self.user.id}))
+
+    def post(self, body):
+        response = self.client.post('/graphql/', json.dumps(body), content_type='application/json')
+        return response.status_code, json.loads(response.content)
+
+    def test_document_cache(self):
+        backend = CachedDocumentBackend(maxsize=2)
+        gql = "query { programTags { tag } }"
+
+        document = backend.document_from_string(schema, gql)
+        self.assertIs(document, backend.document_from_string(schema, gql))
+        context = Context()
+        context.user = self.user
+        self.assertEqual(3, len(document.execute(context=context).data['programTags']))
+
+        # invalid documents are cached with their errors
+        invalid = backend.document_from_string(schema, "query { programTags { unknown } }")
+        self.assertEqual(1, len(invalid.validation_errors))
+        self.assertTrue(invalid.execute().invalid)
+
+        backend.document_from_string(schema, "query { me { name } }")
+        self.assertEqual(2, len(backend.documents))
+        self.assertIsNot(document, backend.document_from_string(schema, gql))
+
+    def test_document_cache_parsed_once(self):
+        gql = "query { programTags { id tag } }"
+        document_backend.documents.clear()
+
+        with mock.patch('django_server.graphene.backend.parse', wraps=parse) as parse_mock:
+            for _ in range(3):
+                status, result = self.post({'query': gql})
+                self.assertEqual(200, status)
+                self.assertEqual(3, len(result['data']['programTags']))
+
+        self.assertEqual(1, parse_mock.call_count)
+
+    def test_preload(self):
+        document_backend.documents.clear()
+        with mock.patch('django_server.libs.preload.connections') as connections_mock:
+            preload()
+        connections_mock.close_all.assert_called_once_with()
+        self.assertEqual(len(persisted_queries.queries), len(document_backend.documents))
+
+        # the preloaded tags are served without a query until they are older than max_age
+        self.client = Client()
+        with self.assertNumQueries(0):
+            status, result = self.post({'operationId': 'ProgramTags'})
+        self.assertEqual(3, len(result['data']['programTags']))
+
+        # saved here, the snapshot is reloaded right away
+        ProgramTag.objects.create(tag='new')
+        status, result = self.post({'operationId': 'ProgramTags'})
+        self.assertEqual(4, len(result['data']['programTags']))
+
+        # changes made elsewhere show up once the snapshot is older than max_age
+        ProgramTag.objects.filter(tag='new').update(is_active=False)
+        status, result = self.post({'operationId': 'ProgramTags'})
+        self.assertEqual(4, len(result['data']['programTags']))
+        with freeze_time(datetime.now() + timedelta(seconds=program_tags.max_age + 1)):
+            status, result = self.post({'operationId': 'ProgramTags'})
+        self.assertEqual(3, len(result['data']['programTags']))
+
+    def test_persisted_query(self):
+        status, result = self.post({'operationId': 'ProgramTags'})
+        self.assertEqual(200, status)
+        self.assertEqual(3, len(result['data']['programTags']))
+
+        status, result = self.post({'operationId': 'Unknown'})
+        self.assertEqual(400, status)
+
+    def test_persisted_queries_valid(self):
+        for operation_id, query in persisted_queries.queries.items():
+            document = CachedDocumentBackend().document_from_string(schema, query)
+            self.assertIn(operation_id, document.operations_map)
+            self.assertEqual([], document.validation_errors, operation_id)
+
+    def test_cache_control(self):
+        client = Client()
+        response = client.get('/graphql/', {'operationId': 'AllPrograms', 'variables': json.dumps({'first': 10})},
+                              HTTP_ACCEPT='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('allPrograms', json.loads(response.content)['data'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        response = client.get('/graphql/', {'operationId': 'ProgramTags'}, HTTP_ACCEPT='application/json')
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+        # queries sent with a token, query texts, per user fields and POST requests are never cached
+        response = self.client.get('/graphql/', {'operationId': 'ProgramTags'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Cache-Control'))
+
+        response = client.get('/graphql/', {'query': "{ programTags { tag } }"}, HTTP_ACCEPT='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Cache-Control'))
+
+        response = client.get('/graphql/', {'query': "{ allPrograms { edges { node { name isEditable } } } }"},
+                              HTTP_ACCEPT='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Cache-Control'))
+
+        response = client.post('/graphql/', json.dumps({'operationId': 'ProgramTags'}), content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Cache-Control'))
+
+    def test_cacheable_response_without_cookie(self):
+        # nginx does not store responses that set or vary on cookies
+        response = Client().get('/graphql/', {'operationId': 'ProgramTags'}, HTTP_ACCEPT='application/json')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertFalse(response.has_header('Set-Cookie'))
+        self.assertEqual({}, dict(response.cookies))
+        self.assertNotIn('cookie', response.get('Vary', '').lower())
+
+        # the rest still gets the csrf cookie graphiql needs
+        response = Client().post('/graphql/', json.dumps({'operationId': 'ProgramTags'}),
+                                 content_type='application/json')
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+    def test_cache_hints(self):
+        def max_age(gql):
+            return get_max_age(schema, parse(gql))
+
+        self.assertEqual(300, max_age("{ programTags { tag } }"))
+        self.assertEqual(60, max_age("{ allPrograms { totalCount edges { cursor node { name tag { tag } } } } }"))
+        self.assertEqual(60, max_age("{ allPrograms { edges { node { ...program } } } } "
+                                     "fragment program on Program { name space { name } }"))
+        self.assertEqual(0, max_age("{ allPrograms { edges { node { owner { name } } } } }"))
+        self.assertEqual(0, max_age("{ me { name } }"))
+        self.assertEqual(0, max_age("{ programTags { tag } me { name } }"))
+        self.assertEqual(0, max_age("mutation { deleteProgram(id: \"1\") { ok } }"))
+
+    def test_query_cost(self):
+        def cost(gql, variables=None):
+            return get_query_cost(schema, parse(gql), variables=variables).to_dict()
+
+        self.assertEqual({'cost': 1, 'depth': 2}, cost("{ programTags { tag } }"))
+        self.assertEqual({'cost': 11, 'depth': 3},
+                         cost("{ allPrograms(first: 10) { totalCount edges { node { name space { name } } } } }"))
+        self.assertEqual({'cost': 7, 'depth': 3},
+                         cost("query ($first: Int = 10) { allPrograms(first: $first) { edges { node { tag { tag } "
+                              "space { name } } } } }", {'first': 3}))
+        self.assertEqual({'cost': 1 + 5 * (1 + 100 * 1), 'depth': 4},
+                         cost("{ allPrograms(first: 5) { edges { node { meeting { edges { node { "
+                              "program { name } } } } } } } }"))
+
+    def test_query_limits(self):
+        gql = "{ allPrograms { edges { node { meeting { edges { node { program { meeting { edges { node { " \
+              "program { name } } } } } } } } } } } }"
+
+        client = Client()
+        response = client.post('/graphql/', json.dumps({'query': gql}), content_type='application/json')
+        self.assertEqual(400, response.status_code)
+        result = json.loads(response.content)
+        self.assertIn('too expensive', result['errors'][0]['message'])
+        self.assertEqual(1 + 100 * (1 + 100 * (1 + (1 + 100 * 1))), result['extensions']['cost']['cost'])
+
+        status, result = self.post({'operationId': 'AllPrograms', 'variables': {'first': 10}})
+        self.assertEqual(200, status)
+        self.assertEqual({'cost': 21, 'depth': 3}, result['extensions']['cost'])
+
+        # the operations of a batch share the budget
+        gql = "{ allPrograms(first: 9) { edges { node { meeting { edges { node { program { name } } } } } } } }"
+        response = client.post('/graphql/', json.dumps([{'query': gql}] * 3), content_type='application/json')
+        result = json.loads(response.content)
+        self.assertEqual([200, 200, 400], [x['status'] for x in result])
+        self.assertEqual(1 + 9 * (1 + 100 * 1), result[0]['extensions']['cost']['cost'])
+        self.assertIn('too expensive: 2730 > 2000', result[2]['errors'][0]['message'])
+
+    def test_batch(self):
+        body = [
+            {'id': 'me', 'query': "query { me { name } }"},
+            {'id': 'tags', 'operationId': 'ProgramTags'},
+            {'id': 'programs', 'query': "query { allPrograms { edges { node { name } } } }"},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            status, result = self.post(body)
+        self.assertEqual(200, status)
+        self.assertEqual(['me', 'tags', 'programs'], [x['id'] for x in result])
+        self.assertEqual('TestAdmin', result[0]['data']['me']['name'])
+        self.assertEqual(3, len(result[1]['data']['programTags']))
+        self.assertEqual([], result[2]['data']['allPrograms']['edges'])
+        # the profile is loaded once for the whole batch
+        self.assertEqual(1, len([x for x in queries if 'FROM "django_server_profile"' in x['sql']]))
+
+        status, result = self.post(body + [{'operationId': 'Unknown'}])
+        self.assertEqual(400, status)
+
+        status, result = self.post(body * 4)
+        self.assertEqual(400, status)
+
+    def test_authentication(self):
+        verified_tokens.clear()
+        revocations.rebuild()
+        activity.flush()
+        with mock.patch('django_server.libs.authentification.jwt.decode', wraps=jwt.decode) as decode_mock:
+            for _ in range(2):
+                # the token carries the claims, `me` loads the profile with its user
+                with self.assertNumQueries(1):
+                    status, result = self.post({'query': "query { me { name email } }"})
+                self.assertEqual(200, status)
+                self.assertEqual('test_admin@test.ai', result['data']['me']['email'])
+        self.assertEqual(1, decode_mock.call_count)
+
+        activity.flush()
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_seen)
+        self.assertIsNone(self.user.last_signin)
+
+        token = AuthHelper.generate_token({'user_id': self.user.id})
+        self.assertEqual(self.user.id, AuthHelper.verify_token(token)[0]['user_id'])
+        self.assertIsNone(AuthHelper.verify_token('invalid'))
+
+        # cached tokens still expire
+        with freeze_time(datetime.utcnow() + timedelta(days=TOKEN_VALID_DAYS + 1)):
+            self.assertIsNone(AuthHelper.verify_token(token))
+        self.assertNotIn(token, verified_tokens)
+
+    def test_middleware_routes(self):
+        response = self.client.post('/graphql/', json.dumps({'query': "query { me { name } }"}),
+                                    content_type='application/json', HTTP_ORIGIN='https://manna.test')
+        self.assertEqual(200, response.status_code)
+        # the API chain: cors and token auth, no sessions or framing headers
+        self.assertEqual(self.user.id, response.wsgi_request.user.id)
+        self.assertIn('Access-Control-Allow-Origin', response)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertNotIn('sessionid', response.cookies)
+
+        response = self.client.get('/admin/login/')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('X-Frame-Options', response)
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_refresh_token(self):
+        gql = """
+        mutation Signin($email:String!, $password:String!) {
+            signin(email:$email, password:$password) {
+                token
+                refreshToken
+            }
+        }
+        """
+        status, result = self.post({'query': gql, 'variables': {'email': 'test_admin@test.ai', 'password': 'password'}})
+        token = result['data']['signin']['token']
+        refresh_token = result['data']['signin']['refreshToken']
+        self.assertEqual(ManClassEnum.MEMBER.value, AuthHelper.verify_token(token)[0]['role'])
+        self.assertIsNone(AuthHelper.verify_token(refresh_token))
+
+        gql = """
+        mutation RefreshToken($refreshToken:String!) {
+            refreshToken(refreshToken:$refreshToken) {
+                token
+                error {
+                    key
+                }
+            }
+        }
+        """
+        data = self.execute(gql, {'refreshToken': refresh_token})['refreshToken']
+        self.assertEqual(self.user.id, AuthHelper.verify_token(data['token'])[0]['user_id'])
+
+        data = self.execute(gql, {'refreshToken': token})['refreshToken']
+        self.assertIsNone(data['token'])
+        self.assertEqual(MannaError.INVALID_TOKEN.name, data['error']['key'])
+
+        # deactivated users are cut off without waiting for their access token to expire
+        self.user.status = UserStatusEnum.INACTIVE.value
+        self.user.save()
+        revocations.rebuild()
+
+        client = Client(HTTP_AUTHORIZATION=token)
+        response = client.post('/graphql/', json.dumps({'query': "query { me { name } }"}),
+                               content_type='application/json')
+        self.assertIsNone(json.loads(response.content)['data']['me'])
+
+        data = self.execute(gql, {'refreshToken': refresh_token})['refreshToken']
+        self.assertEqual(MannaError.INVALID_TOKEN.name, data['error']['key'])
+
+    def test_token_revocation(self):
+        def revoked():
+            return TokenRevocation.objects.filter(profile_id=profile.id).count()
+
+        profile = self.create_user(email='revoked@manna.com')
+        profile = Profile.objects.get(id=profile.id)
+        profile.name = 'renamed'
+        # compared with the loaded values, no extra query
+        with self.assertNumQueries(1):
+            profile.save()
+        self.assertEqual(0, revoked())
+
+        profile.status = UserStatusEnum.INACTIVE.value
+        profile.save()
+        profile.save()
+        self.assertEqual(1, revoked())
+
+        Profile.objects.filter(id=profile.id).update(role=ManClassEnum.ADMIN.value)
+        Profile.objects.filter(id=profile.id).update(name='again')
+        self.assertEqual(2, revoked())
+
+        # the profile goes along with its user
+        profile.user.delete()
+        self.assertEqual(3, revoked())
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(i)
+
+        self.assertTrue(all(i in bloom for i in range(1000)))
+        self.assertLess(len([i for i in range(1000, 11000) if i in bloom]), 300)
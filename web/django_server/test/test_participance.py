@@ -1,8 +1,15 @@
 import logging
+from unittest import mock
+
+from django.db import DatabaseError, IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 
 from django_server.const import ProgramStateEnum, MannaError, ManClassEnum
 from django_server.graphene.utils import get_global_id_from_object
-from django_server.models import ProgramParticipant, MeetingParticipant
+from django_server.libs.attendance import AttendanceBuffer, attendance
+from django_server.libs.flusher import PeriodicFlusher
+from django_server.models import (NoSeatLeft, Meeting, Program, ProgramParticipant, ProgramWaiter, MeetingAttendance,
+                                  MeetingParticipant, MeetingWaiter)
 from django_server.test.test_base import BaseTestCase
 
 logger = logging.getLogger(__name__)
@@ -169,3 +176,396 @@ class ParticipanceTestCase(BaseTestCase):
         self.assertEqual(1, MeetingParticipant.objects.filter(meeting=meeting).count())
         self.assertEqual(user.user.username,
                          MeetingParticipant.objects.filter(meeting=meeting).first().participant.user.username)
+
+    def test_seats_taken(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user,
+                                      participants_max=2)
+        meeting = self.create_meeting(name='미팅1', program=program)
+        user1 = self.create_user(username='second_user', email='second@dev.ai')
+        user2 = self.create_user(username='third_user', email='third@dev.ai')
+
+        gql = """
+        mutation ParticipateProgram($programId:ID!) {
+            participateProgram(programId:$programId) {
+                error {
+                    key
+                }
+            }
+        }
+        """
+        variables = {
+            'programId': get_global_id_from_object('Program', program.pk),
+        }
+
+        # a seat is claimed by one conditional update, the participants are never counted
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(self.execute(gql, variables, user=self.user)['participateProgram']['error'])
+        self.assertFalse([x for x in queries if 'COUNT(' in x['sql'].upper()])
+
+        self.assertIsNone(self.execute(gql, variables, user=user1)['participateProgram']['error'])
+        data = self.execute(gql, variables, user=user2)['participateProgram']['error']
+        self.assertEqual(MannaError.MAX_PARTICIPANT.name, data['key'])
+        program.refresh_from_db()
+        self.assertEqual(2, program.seats_taken)
+
+        # a failed insert gives its seat back
+        ProgramParticipant.objects.filter(program=program, participant=user1).first().delete()
+        with self.assertRaises(IntegrityError):
+            ProgramParticipant.objects.create(program=program, participant=self.user)
+        program.refresh_from_db()
+        self.assertEqual(1, program.seats_taken)
+
+        # meeting seats are limited by the program
+        MeetingParticipant.objects.create(meeting=meeting, participant=self.user)
+        MeetingParticipant.objects.create(meeting=meeting, participant=user1)
+        with self.assertRaises(NoSeatLeft):
+            MeetingParticipant.objects.create(meeting=meeting, participant=user2)
+
+        MeetingParticipant.objects.get(meeting=meeting, participant=user1).delete()
+        meeting.refresh_from_db()
+        self.assertEqual(1, meeting.seats_taken)
+
+        # a second delete of the same row releases nothing
+        participant = MeetingParticipant.objects.get(meeting=meeting, participant=self.user)
+        MeetingParticipant.objects.get(id=participant.id).delete()
+        self.assertEqual(0, participant.delete()[0])
+        meeting.refresh_from_db()
+        self.assertEqual(0, meeting.seats_taken)
+
+    def test_seats_taken_not_saved(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        meeting = self.create_meeting(name='미팅1', program=program)
+        user1 = self.create_user(username='second_user', email='second@dev.ai')
+
+        # loaded before someone joins, saved after: the stored counts stay
+        program = Program.objects.get(id=program.id)
+        meeting = Meeting.objects.get(id=meeting.id)
+        ProgramParticipant.objects.create(program=Program.objects.get(id=program.id), participant=user1)
+        MeetingParticipant.objects.create(meeting=Meeting.objects.get(id=meeting.id), participant=user1)
+
+        program.name = '프로그램2'
+        program.save()
+        meeting.name = '미팅2'
+        meeting.save()
+
+        program.refresh_from_db()
+        meeting.refresh_from_db()
+        self.assertEqual(('프로그램2', 1), (program.name, program.seats_taken))
+        self.assertEqual(('미팅2', 1), (meeting.name, meeting.seats_taken))
+
+    def test_wait_program(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user,
+                                      participants_max=1)
+        user1 = self.create_user(username='second_user', email='second@dev.ai')
+        user2 = self.create_user(username='third_user', email='third@dev.ai')
+
+        gql = """
+        mutation WaitProgram($programId:ID!) {
+            waitProgram(programId:$programId) {
+                programParticipant {
+                    participant {
+                        name
+                    }
+                }
+                programWaiter {
+                    participant {
+                        name
+                    }
+                }
+                error {
+                    key
+                }
+            }
+        }
+        """
+        variables = {
+            'programId': get_global_id_from_object('Program', program.pk),
+        }
+
+        # a free seat is taken right away
+        data = self.execute(gql, variables, user=self.user)['waitProgram']
+        self.assertEqual(self.user.name, data['programParticipant']['participant']['name'])
+        data = self.execute(gql, variables, user=self.user)['waitProgram']
+        self.assertEqual(MannaError.DUPLICATED.name, data['error']['key'])
+
+        for user in [user1, user2, user1]:
+            data = self.execute(gql, variables, user=user)['waitProgram']
+            self.assertIsNone(data['programParticipant'])
+            self.assertEqual(user.name, data['programWaiter']['participant']['name'])
+        self.assertEqual(2, ProgramWaiter.objects.filter(program=program).count())
+
+        # leaving promotes the first waiter in the same transaction
+        ProgramParticipant.objects.get(program=program, participant=self.user).delete()
+        self.assertEqual(user1.id, ProgramParticipant.objects.get(program=program).participant_id)
+        self.assertEqual([user2.id], list(ProgramWaiter.objects.values_list('participant_id', flat=True)))
+        program.refresh_from_db()
+        self.assertEqual(1, program.seats_taken)
+
+        gql = """
+        mutation CancelWaitProgram($programId:ID!) {
+            cancelWaitProgram(programId:$programId) {
+                ok
+            }
+        }
+        """
+        self.assertTrue(self.execute(gql, variables, user=user2)['cancelWaitProgram']['ok'])
+        self.assertFalse(self.execute(gql, variables, user=user2)['cancelWaitProgram']['ok'])
+
+        ProgramParticipant.objects.get(program=program, participant=user1).delete()
+        program.refresh_from_db()
+        self.assertEqual(0, program.seats_taken)
+
+        # seats added by a larger participantsMax go to the waiters too
+        meeting = self.create_meeting(name='미팅1', program=program)
+        ProgramParticipant.objects.create(program=program, participant=user1)
+        MeetingParticipant.objects.create(meeting=meeting, participant=user1)
+        ProgramWaiter.objects.create(program=program, participant=user2)
+        MeetingWaiter.objects.create(meeting=meeting, participant=user2)
+
+        gql = """
+        mutation UpdateProgram($id:ID!, $participantsMax:Int) {
+            updateProgram(id:$id, participantsMax:$participantsMax) {
+                program {
+                    seatsLeft
+                }
+            }
+        }
+        """
+        data = self.execute(gql, {'id': variables['programId'], 'participantsMax': 3}, user=self.user)
+        self.assertEqual(1, data['updateProgram']['program']['seatsLeft'])
+        self.assertTrue(ProgramParticipant.objects.filter(program=program, participant=user2).exists())
+        self.assertTrue(MeetingParticipant.objects.filter(meeting=meeting, participant=user2).exists())
+        self.assertFalse(ProgramWaiter.objects.exists())
+        self.assertFalse(MeetingWaiter.objects.exists())
+
+    def test_wait_meeting(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user,
+                                      participants_max=2)
+        meeting = self.create_meeting(name='미팅1', program=program)
+        user1 = self.create_user(username='second_user', email='second@dev.ai')
+        user2 = self.create_user(username='third_user', email='third@dev.ai')
+
+        gql = """
+        mutation WaitMeeting($meetingId:ID!) {
+            waitMeeting(meetingId:$meetingId) {
+                meetingWaiter {
+                    participant {
+                        name
+                    }
+                }
+            }
+        }
+        """
+        variables = {
+            'meetingId': get_global_id_from_object('Meeting', meeting.pk),
+        }
+
+        MeetingParticipant.objects.create(meeting=meeting, participant=self.user)
+        # user1 queued earlier, then joined on their own while a seat was free
+        MeetingWaiter.objects.create(meeting=meeting, participant=user1)
+        MeetingParticipant.objects.create(meeting=meeting, participant=user1)
+        data = self.execute(gql, variables, user=user2)['waitMeeting']
+        self.assertEqual(user2.name, data['meetingWaiter']['participant']['name'])
+
+        # the stale entry is dropped and the next waiter promoted
+        MeetingParticipant.objects.get(meeting=meeting, participant=self.user).delete()
+        self.assertEqual({user1.id, user2.id},
+                         set(MeetingParticipant.objects.filter(meeting=meeting).values_list('participant_id', flat=True)))
+        self.assertFalse(MeetingWaiter.objects.exists())
+
+    def test_enroll_participants(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user,
+                                      participants_max=4)
+        users = [self.create_user(username=f'user{i}', email=f'user{i}@test.ai') for i in range(5)]
+        ProgramParticipant.objects.create(program=program, participant=users[0])
+        ProgramWaiter.objects.create(program=program, participant=users[4])
+
+        gql = """
+        mutation EnrollParticipants($programId:ID!, $userIds:[ID]!) {
+            enrollParticipants(programId:$programId, userIds:$userIds) {
+                program {
+                    participantCount
+                }
+                errors {
+                    idx
+                    error {
+                        key
+                    }
+                }
+            }
+        }
+        """
+        variables = {
+            'programId': get_global_id_from_object('Program', program.pk),
+            'userIds': [get_global_id_from_object('Profile', x.pk) for x in users[:3]] +
+                       [get_global_id_from_object('Profile', 0)] +
+                       [get_global_id_from_object('Profile', x.pk) for x in users[3:]],
+        }
+
+        data = self.execute(gql, variables, user=self.user)['enrollParticipants']
+        self.assertEqual(4, data['program']['participantCount'])
+        self.assertEqual([(0, MannaError.DUPLICATED.name), (3, MannaError.DOES_NOT_EXIST.name),
+                          (5, MannaError.MAX_PARTICIPANT.name)],
+                         [(x['idx'], x['error']['key']) for x in data['errors']])
+        self.assertEqual(4, ProgramParticipant.objects.filter(program=program).count())
+
+        data = self.execute(gql, variables, user=users[1])['enrollParticipants']
+        self.assertIsNone(data['program'])
+
+        gql = """
+        mutation RemoveParticipants($programId:ID!, $userIds:[ID]!) {
+            removeParticipants(programId:$programId, userIds:$userIds) {
+                program {
+                    participantCount
+                }
+                errors {
+                    idx
+                }
+            }
+        }
+        """
+        variables['userIds'] = [get_global_id_from_object('Profile', x.pk) for x in [users[1], users[2], users[4]]]
+
+        # the freed seats go to the waiters, users[4] was still waiting and is promoted
+        data = self.execute(gql, variables, user=self.user)['removeParticipants']
+        self.assertEqual([2], [x['idx'] for x in data['errors']])
+        self.assertEqual(3, data['program']['participantCount'])
+        self.assertEqual({users[0].id, users[3].id, users[4].id},
+                         set(ProgramParticipant.objects.filter(program=program)
+                             .values_list('participant_id', flat=True)))
+        self.assertFalse(ProgramWaiter.objects.exists())
+
+        # an unknown program is an error, not a crash
+        gql = """
+        mutation RemoveParticipants($programId:ID!, $userIds:[ID]!) {
+            removeParticipants(programId:$programId, userIds:$userIds) {
+                error {
+                    key
+                }
+            }
+        }
+        """
+        variables['programId'] = get_global_id_from_object('Program', 0)
+        data = self.execute(gql, variables, user=self.user)['removeParticipants']
+        self.assertEqual(MannaError.DOES_NOT_EXIST.name, data['error']['key'])
+
+        gql = gql.replace('RemoveParticipants', 'EnrollParticipants')
+        gql = gql.replace('removeParticipants', 'enrollParticipants')
+        data = self.execute(gql, variables, user=self.user)['enrollParticipants']
+        self.assertEqual(MannaError.DOES_NOT_EXIST.name, data['error']['key'])
+
+    def test_enroll_participants_queries(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user,
+                                      participants_max=200)
+        users = [self.create_user(username=f'user{i}', email=f'user{i}@test.ai') for i in range(30)]
+
+        gql = """
+        mutation EnrollParticipants($programId:ID!, $userIds:[ID]!) {
+            enrollParticipants(programId:$programId, userIds:$userIds) {
+                errors {
+                    idx
+                }
+            }
+        }
+        """
+        variables = {
+            'programId': get_global_id_from_object('Program', program.pk),
+            'userIds': [get_global_id_from_object('Profile', x.pk) for x in users],
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute(gql, variables, user=self.user)['enrollParticipants']
+        self.assertEqual([], data['errors'])
+        self.assertEqual(30, ProgramParticipant.objects.filter(program=program).count())
+        self.assertEqual(7, len([x for x in queries if 'SAVEPOINT' not in x['sql']]))
+
+    def test_check_in(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        meeting = self.create_meeting(name='미팅1', program=program)
+        user1 = self.create_user(username='second_user', email='second@dev.ai')
+        user2 = self.create_user(username='third_user', email='third@dev.ai')
+        MeetingParticipant.objects.create(meeting=meeting, participant=self.user)
+        MeetingParticipant.objects.create(meeting=meeting, participant=user1)
+
+        gql = """
+        mutation CheckIn($argument:[CheckInInput]!) {
+            checkIn(argument:$argument) {
+                ok
+                errors {
+                    idx
+                    error {
+                        key
+                        message
+                    }
+                }
+            }
+        }
+        """
+        meeting_id = get_global_id_from_object('Meeting', meeting.pk)
+        variables = {
+            'argument': [
+                {'meetingId': meeting_id},
+                {'meetingId': meeting_id, 'userId': get_global_id_from_object('Profile', user1.pk)},
+                {'meetingId': meeting_id, 'userId': get_global_id_from_object('Profile', user2.pk)},
+                {'meetingId': get_global_id_from_object('Meeting', 0)},
+                {'meetingId': meeting_id},
+                {'meetingId': meeting_id, 'userId': get_global_id_from_object('Profile', 0)},
+            ]
+        }
+
+        # validated in one query, the rows are written behind
+        attendance.flush()
+        with self.assertNumQueries(1):
+            data = self.execute(gql, variables, user=self.user)['checkIn']
+        self.assertFalse(data['ok'])
+        self.assertEqual([(2, 'not participating'), (3, 'no such meeting'), (5, 'no such user')],
+                         [(x['idx'], x['error']['message']) for x in data['errors']])
+        self.assertEqual({MannaError.DOES_NOT_EXIST.name}, {x['error']['key'] for x in data['errors']})
+        self.assertFalse(MeetingAttendance.objects.exists())
+
+        self.assertEqual(2, attendance.flush())
+        self.assertEqual({self.user.id, user1.id},
+                         set(MeetingAttendance.objects.filter(meeting=meeting).values_list('participant_id', flat=True)))
+
+        # only the program's owner or an admin checks in others, checking in twice changes nothing
+        argument = [{'meetingId': meeting_id, 'userId': get_global_id_from_object('Profile', self.user.pk)},
+                    {'meetingId': meeting_id}]
+        data = self.execute(gql, {'argument': argument}, user=user1)['checkIn']
+        self.assertEqual([(0, MannaError.INVALID_PERMISSION.name)],
+                         [(x['idx'], x['error']['key']) for x in data['errors']])
+        attendance.flush()
+        self.assertEqual(2, MeetingAttendance.objects.filter(meeting=meeting).count())
+
+    def test_attendance_flush_error(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        meeting = self.create_meeting(name='미팅1', program=program)
+        user1 = self.create_user(username='second_user', email='second@dev.ai')
+        buffer = AttendanceBuffer(interval=60, batch_size=10)
+
+        # a profile deleted after its check-in was accepted is dropped, the others are kept
+        buffer.add([(meeting.id, self.user.id), (meeting.id, user1.id)])
+        user1.user.delete()
+        with self.assertLogs('django_server.libs.attendance', level='WARNING'):
+            self.assertEqual(1, buffer.flush())
+        self.assertEqual([self.user.id], list(MeetingAttendance.objects.values_list('participant_id', flat=True)))
+
+        # other errors keep the batch for the next flush
+        buffer.add([(meeting.id, self.user.id)])
+        with mock.patch('django_server.libs.attendance.insert', side_effect=DatabaseError("down")):
+            self.assertEqual(0, buffer.flush())
+        self.assertEqual([(meeting.id, self.user.id)], list(buffer.pending))
+        self.assertEqual(1, buffer.flush())
+
+    def test_periodic_flush(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        meeting = self.create_meeting(name='미팅1', program=program)
+        buffer = AttendanceBuffer(interval=60, batch_size=10)
+        flusher = PeriodicFlusher([buffer])
+
+        # accepted check-ins are written once the interval has passed, without a later check-in
+        buffer.add([(meeting.id, self.user.id)])
+        with mock.patch.object(connection, 'close'):
+            self.assertEqual(0, flusher.flush_due())
+            buffer.flushed_at -= 60
+            self.assertEqual(1, flusher.flush_due())
+        self.assertTrue(MeetingAttendance.objects.filter(meeting=meeting, participant=self.user).exists())
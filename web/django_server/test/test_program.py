@@ -1,6 +1,9 @@
 import logging
 from datetime import datetime
 
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+
 from django_server.const import ProgramStateEnum, ManClassEnum, MannaError, ProgramTagTypeEnum
 from django_server.graphene.utils import get_global_id_from_object
 from django_server.models import Program, Meeting, ProgramParticipant, MeetingParticipant, ProgramTag
@@ -52,6 +55,30 @@ class SpaceTestCase(BaseTestCase):
         program = Program.objects.first()
         self.assertIsNotNone(ProgramParticipant.objects.get(program=program, participant=self.user))
 
+        # the owner takes the first seat
+        gql = """
+        mutation CreateProgram($name:String!, $participantsMax:Int, $tagId:ID!) {
+            createProgram(name:$name, participantsMax:$participantsMax, tagId:$tagId) {
+                program {
+                    name
+                }
+                error {
+                    key
+                }
+            }
+        }
+        """
+        variables = {
+            'name': '프로그램2',
+            'participantsMax': 0,
+            'tagId': get_global_id_from_object('ProgramTag', tag.pk)
+        }
+
+        data = self.execute(gql, variables, user=self.user)['createProgram']
+        self.assertIsNone(data['program'])
+        self.assertEqual(MannaError.INVALID_PARAMETER.name, data['error']['key'])
+        self.assertEqual(1, Program.objects.all().count())
+
     def test_update_program(self):
         program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
         tag = ProgramTag.objects.last()
@@ -218,7 +245,10 @@ class SpaceTestCase(BaseTestCase):
     def test_delete_meeting(self):
         program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
         meeting1 = self.create_meeting(name='미팅1', program=program)
-        self.create_meeting(name='미팅2', program=program)
+        self.create_meeting(name='미팅2',
+                            program=program,
+                            start_time=datetime(2020, 3, 1, 12, 0),
+                            end_time=datetime(2020, 3, 1, 13, 0))
 
         gql = """
         mutation DeleteMeeting($id:ID!) {
@@ -320,8 +350,8 @@ class SpaceTestCase(BaseTestCase):
         """
         variables = {
             'name': 'meet1',
-            'startTime': '2020-03-01T13:30:00+09:00',
-            'endTime': '2020-03-01T14:30:00+09:00',
+            'startTime': '2020-03-01T12:30:00+09:00',
+            'endTime': '2020-03-01T13:30:00+09:00',
             'id': meeting_id,
             'spaceId': get_global_id_from_object('Space', program.space.pk)
         }
@@ -452,6 +482,76 @@ class SpaceTestCase(BaseTestCase):
         self.assertEqual(variables['name'], data['meeting']['name'])
         self.assertEqual('Zoom1', data['meeting']['zoom']['name'])
 
+    def test_check_for_containing_reservations(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        self.create_meeting(name='미팅1',
+                            program=program,
+                            start_time=datetime(2020, 3, 1, 12, 0),
+                            end_time=datetime(2020, 3, 1, 13, 0))
+
+        gql = """
+        mutation CreateMeeting($arg:MeetingInput!) {
+            createMeeting(argument:$arg) {
+                meeting {
+                    name
+                }
+                error {
+                    key
+                }
+            }
+        }
+        """
+        variables = {
+            'arg': {
+                'name': 'meet1',
+                'startTime': '2020-03-01T11:00:00+09:00',
+                'endTime': '2020-03-01T14:00:00+09:00',
+                'programId': get_global_id_from_object('Program', program.pk),
+                'spaceId': get_global_id_from_object('Space', program.space.pk)
+            }
+        }
+
+        data = self.execute(gql, variables, user=self.user)['createMeeting']
+        self.assertEqual(MannaError.DUPLICATED.name, data['error']['key'])
+        self.assertIsNone(data['meeting'])
+        self.assertEqual(1, Meeting.objects.all().count())
+
+    def test_exclusion_constraint_reservations(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        meeting = self.create_meeting(name='미팅1',
+                                      program=program,
+                                      start_time=datetime(2020, 3, 1, 12, 0),
+                                      end_time=datetime(2020, 3, 1, 13, 0))
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_meeting(name='미팅2',
+                                program=program,
+                                start_time=datetime(2020, 3, 1, 12, 30),
+                                end_time=datetime(2020, 3, 1, 13, 30))
+
+        # moving a meeting inside its own reservation is not a conflict
+        gql = """
+        mutation UpdateMeeting($id:ID!, $startTime:DateTime, $endTime:DateTime) {
+            updateMeeting(id:$id, startTime:$startTime, endTime:$endTime) {
+                meeting {
+                    startTime
+                }
+                error {
+                    key
+                }
+            }
+        }
+        """
+        variables = {
+            'id': get_global_id_from_object('Meeting', meeting.pk),
+            'startTime': '2020-03-01T12:30:00+09:00',
+            'endTime': '2020-03-01T13:30:00+09:00',
+        }
+
+        data = self.execute(gql, variables, user=self.user)['updateMeeting']
+        self.assertIsNone(data['error'])
+        self.assertEqual(variables['startTime'], data['meeting']['startTime'])
+
     def test_program_participant(self):
         program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user, participants_max=4)
         user1 = self.create_user('user1', 'user1@test.ai', 'password')
@@ -619,6 +719,251 @@ class SpaceTestCase(BaseTestCase):
         data = self.execute(gql, variables=variables, user=admin)['program']
         self.assertTrue(data['isEditable'])
 
+    def test_all_programs_batched(self):
+        space = self.create_space(user=self.user)
+        gql = """
+        query AllPrograms {
+            allPrograms {
+                edges {
+                    node {
+                        name
+                        isEditable
+                        space {
+                            name
+                            building {
+                                name
+                            }
+                        }
+                        owner {
+                            name
+                            email
+                        }
+                        tag {
+                            tag
+                        }
+                    }
+                }
+            }
+        }
+        """
+
+        def all_programs(count):
+            for i in range(count):
+                owner = self.create_user(f'owner{count}-{i}', f'owner{count}-{i}@test.ai')
+                self.create_program(name=f'프로그램{i}', user=owner, space=space)
+
+            with CaptureQueriesContext(connection) as queries:
+                data = self.execute(gql, user=self.user)['allPrograms']['edges']
+            self.assertEqual(count, len(data))
+            return queries
+
+        few = all_programs(2)
+        Program.objects.all().delete()
+        many = all_programs(10)
+        self.assertEqual(len(few), len(many))
+
+    def test_all_programs_optimized(self):
+        self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        gql = """
+        query AllPrograms {
+            allPrograms {
+                edges {
+                    node {
+                        ...ProgramFields
+                        space {
+                            name
+                        }
+                    }
+                }
+            }
+        }
+
+        fragment ProgramFields on Program {
+            name
+            imageUrl
+        }
+        """
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute(gql, user=self.user)['allPrograms']['edges']
+        self.assertEqual('프로그램1', data[0]['node']['name'])
+        self.assertEqual('img_', data[0]['node']['imageUrl'][:4])
+        self.assertIsNotNone(data[0]['node']['space']['name'])
+
+        # programs joined with spaces, without the unselected description column
+        self.assertEqual(1, len(queries))
+        self.assertIn('JOIN "django_server_space"', queries[0]['sql'])
+        self.assertNotIn('"description"', queries[0]['sql'])
+
+    def test_all_programs_keyset(self):
+        space = self.create_space(user=self.user)
+        for i in range(5):
+            self.create_program(name=f'프로그램{i}', user=self.user, space=space)
+
+        gql = """
+        query AllPrograms($first:Int, $after:String, $last:Int, $before:String) {
+            allPrograms(first:$first, after:$after, last:$last, before:$before) {
+                pageInfo {
+                    hasNextPage
+                    hasPreviousPage
+                    endCursor
+                }
+                edges {
+                    cursor
+                    node {
+                        name
+                    }
+                }
+            }
+        }
+        """
+
+        names = []
+        variables = {'first': 2}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.execute(gql, variables, user=self.user)['allPrograms']
+            self.assertEqual(1, len(queries))
+            self.assertNotIn('OFFSET', queries[0]['sql'])
+
+            names += [x['node']['name'] for x in data['edges']]
+            if not data['pageInfo']['hasNextPage']:
+                break
+            variables = {'first': 2, 'after': data['pageInfo']['endCursor']}
+
+        # the most recently modified program comes first
+        self.assertEqual([f'프로그램{i}' for i in reversed(range(5))], names)
+
+        data = self.execute(gql, {'last': 2, 'before': data['pageInfo']['endCursor']}, user=self.user)['allPrograms']
+        self.assertEqual(['프로그램2', '프로그램1'], [x['node']['name'] for x in data['edges']])
+        self.assertTrue(data['pageInfo']['hasPreviousPage'])
+
+    def test_total_count(self):
+        program = self.create_program(name='프로그램1', user=self.user)
+        for i in range(3):
+            self.create_meeting(name=f'미팅{i}',
+                                program=program,
+                                start_time=datetime(2020, 3, i + 1, 12, 0),
+                                end_time=datetime(2020, 3, i + 1, 13, 0))
+
+        gql = """
+        query AllMeetings($estimated:Boolean) {
+            allMeetings(first:1) {
+                totalCount(estimated:$estimated)
+                edges {
+                    node {
+                        name
+                    }
+                }
+            }
+        }
+        """
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute(gql, {'estimated': False}, user=self.user)['allMeetings']
+        self.assertEqual(3, data['totalCount'])
+        self.assertEqual(1, len(data['edges']))
+        self.assertTrue(any('COUNT(*)' in x['sql'] for x in queries))
+
+        # the whole table is estimated from the planner statistics, never counted
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Meeting._meta.db_table}")
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [Meeting._meta.db_table])
+            reltuples = int(cursor.fetchone()[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute(gql, {'estimated': True}, user=self.user)['allMeetings']
+        self.assertEqual(3, reltuples)
+        self.assertEqual(reltuples, data['totalCount'])
+        self.assertFalse(any('COUNT(' in x['sql'].upper() for x in queries))
+
+    def test_seats_left(self):
+        space = self.create_space(user=self.user)
+        programs = [self.create_program(name=f'프로그램{i}', user=self.user, space=space, participants_max=2)
+                    for i in range(3)]
+        meetings = [self.create_meeting(name=f'미팅{i}',
+                                        program=x,
+                                        start_time=datetime(2020, 3, i + 1, 12, 0),
+                                        end_time=datetime(2020, 3, i + 1, 13, 0))
+                    for i, x in enumerate(programs)]
+        user = self.create_user('user1', 'user1@test.ai', 'password')
+        for x in [self.user, user]:
+            ProgramParticipant.objects.create(program=programs[0], participant=x)
+            MeetingParticipant.objects.create(meeting=meetings[0], participant=x)
+        ProgramParticipant.objects.create(program=programs[1], participant=user)
+
+        gql = """
+        query {
+            allPrograms(first:10) {
+                edges {
+                    node {
+                        name
+                        participantCount
+                        seatsLeft
+                        isFull
+                    }
+                }
+            }
+            allMeetings(first:10) {
+                edges {
+                    node {
+                        name
+                        participantCount
+                        seatsLeft
+                        isFull
+                    }
+                }
+            }
+        }
+        """
+
+        # one query per list, the counts come from the counters and the meetings join their program
+        with self.assertNumQueries(2):
+            data = self.execute(gql, user=self.user)
+        programs = {x['node']['name']: x['node'] for x in data['allPrograms']['edges']}
+        self.assertEqual({'participantCount': 2, 'seatsLeft': 0, 'isFull': True},
+                         {k: v for k, v in programs['프로그램0'].items() if k != 'name'})
+        self.assertEqual(1, programs['프로그램1']['seatsLeft'])
+        self.assertFalse(programs['프로그램2']['isFull'])
+        meetings = {x['node']['name']: x['node'] for x in data['allMeetings']['edges']}
+        self.assertEqual({'participantCount': 2, 'seatsLeft': 0, 'isFull': True},
+                         {k: v for k, v in meetings['미팅0'].items() if k != 'name'})
+        self.assertEqual(2, meetings['미팅1']['seatsLeft'])
+
+        gql = """
+        query Meeting($id:ID!) {
+            meeting(id:$id) {
+                seatsLeft
+                isFull
+            }
+        }
+        """
+        meeting = self.create_meeting(name='미팅3',
+                                      program=Program.objects.get(name='프로그램1'),
+                                      start_time=datetime(2020, 3, 5, 12, 0),
+                                      end_time=datetime(2020, 3, 5, 13, 0))
+        with self.assertNumQueries(1):
+            data = self.execute(gql, {'id': get_global_id_from_object('Meeting', meeting.pk)}, user=self.user)['meeting']
+        self.assertEqual({'seatsLeft': 2, 'isFull': False}, data)
+
+        gql = """
+        mutation ParticipateMeeting($meetingId:ID!) {
+            participateMeeting(meetingId:$meetingId) {
+                meetingParticipant {
+                    meeting {
+                        participantCount
+                        seatsLeft
+                        isFull
+                    }
+                }
+            }
+        }
+        """
+        # meetings that were not optimized load their program through the loader
+        data = self.execute(gql, {'meetingId': get_global_id_from_object('Meeting', meeting.pk)},
+                            user=self.user)['participateMeeting']['meetingParticipant']['meeting']
+        self.assertEqual({'participantCount': 1, 'seatsLeft': 1, 'isFull': False}, data)
+
     def test_zooms(self):
         program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
         zoom1 = self.create_zoom("Zoom1", 'zoom1@hanaui.net', 'hanaui', '123 456 7890', '1Nt',
@@ -834,11 +1179,116 @@ class SpaceTestCase(BaseTestCase):
         self.assertEqual(1, data['errorIdx'])
         self.assertEqual(MannaError.INVALID_TIME.name, data['error']['key'])
 
+    def test_create_meetings_conflicts_in_batch(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        self.create_meeting(name='미팅1',
+                            program=program,
+                            start_time=datetime(2020, 3, 1, 12, 0),
+                            end_time=datetime(2020, 3, 1, 13, 0))
+
+        gql = """
+        mutation CreateMeetings($arg:[MeetingInput]!) {
+            createMeetings(argument:$arg) {
+                errorIdx
+                error {
+                    key
+                }
+                errors {
+                    idx
+                    error {
+                        key
+                    }
+                }
+            }
+        }
+        """
+
+        def argument(name, start_time, end_time):
+            return {
+                'name': name,
+                'startTime': start_time,
+                'endTime': end_time,
+                'programId': get_global_id_from_object('Program', program.pk),
+                'spaceId': get_global_id_from_object('Space', program.space.pk)
+            }
+
+        variables = {
+            'arg': [
+                argument('meet1', '2020-03-02T12:00:00+09:00', '2020-03-02T13:00:00+09:00'),
+                argument('meet2', '2020-03-01T11:00:00+09:00', '2020-03-01T14:00:00+09:00'),   # contains 미팅1
+                argument('meet3', '2020-03-02T12:30:00+09:00', '2020-03-02T13:30:00+09:00'),   # overlaps meet1
+                argument('meet4', '2020-03-02T13:00:00+09:00', '2020-03-02T12:00:00+09:00'),   # invalid time
+                argument('meet5', '2020-03-02T13:30:00+09:00', '2020-03-02T14:00:00+09:00'),
+                argument('meet6', '2020-03-02T13:45:00+09:00', '2020-03-02T13:45:00+09:00'),   # empty, inside meet5
+            ]
+        }
+
+        # one query for every stored meeting in the batch window
+        with self.assertNumQueries(1):
+            data = self.execute(gql, variables, user=self.user)['createMeetings']
+
+        self.assertEqual(1, data['errorIdx'])
+        self.assertEqual(MannaError.DUPLICATED.name, data['error']['key'])
+        self.assertEqual([(1, MannaError.DUPLICATED.name),
+                          (2, MannaError.DUPLICATED.name),
+                          (3, MannaError.INVALID_TIME.name)],
+                         [(x['idx'], x['error']['key']) for x in data['errors']])
+        self.assertEqual(1, Meeting.objects.all().count())
+
+    def test_create_meetings_bulk(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+
+        gql = """
+        mutation CreateMeetings($arg:[MeetingInput]!) {
+            createMeetings(argument:$arg) {
+                errorIdx
+                error {
+                    key
+                }
+                meetings {
+                    name
+                }
+            }
+        }
+        """
+
+        def arguments(day, count, program_id=get_global_id_from_object('Program', program.pk)):
+            return [{
+                'name': f'meet{day}-{i}',
+                'startTime': f'2020-03-{day:02}T{i + 9:02}:00:00+09:00',
+                'endTime': f'2020-03-{day:02}T{i + 10:02}:00:00+09:00',
+                'programId': program_id,
+                'spaceId': get_global_id_from_object('Space', program.space.pk)
+            } for i in range(count)]
+
+        with CaptureQueriesContext(connection) as few:
+            data = self.execute(gql, {'arg': arguments(1, 2)}, user=self.user)['createMeetings']
+        self.assertEqual(['meet1-0', 'meet1-1'], [x['name'] for x in data['meetings']])
+
+        with CaptureQueriesContext(connection) as many:
+            data = self.execute(gql, {'arg': arguments(2, 10)}, user=self.user)['createMeetings']
+        self.assertEqual([f'meet2-{i}' for i in range(10)], [x['name'] for x in data['meetings']])
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(12, Meeting.objects.all().count())
+
+        data = self.execute(gql, {'arg': arguments(3, 2, program_id=get_global_id_from_object('Program', 0))},
+                            user=self.user)['createMeetings']
+        self.assertEqual(0, data['errorIdx'])
+        self.assertEqual(MannaError.DOES_NOT_EXIST.name, data['error']['key'])
+        self.assertEqual(12, Meeting.objects.all().count())
+
     def test_update_meetings(self):
         program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
         meeting1 = self.create_meeting(name='미팅1', program=program)
-        meeting2 = self.create_meeting(name='미팅2', program=program)
-        meeting3 = self.create_meeting(name='미팅3', program=program)
+        meeting2 = self.create_meeting(name='미팅2',
+                                       program=program,
+                                       start_time=datetime(2020, 1, 1, 12, 0),
+                                       end_time=datetime(2020, 1, 1, 13, 0))
+        meeting3 = self.create_meeting(name='미팅3',
+                                       program=program,
+                                       start_time=datetime(2020, 1, 2, 12, 0),
+                                       end_time=datetime(2020, 1, 2, 13, 0))
 
         gql = """
         mutation UpdateMeetings($arg:[MeetingUpdateInput]!) {
@@ -931,3 +1381,46 @@ class SpaceTestCase(BaseTestCase):
         data = self.execute(gql, variables, user=self.user)['updateMeetings']
         self.assertEqual(0, data['errorIdx'])
         self.assertEqual(MannaError.INVALID_TIME.name, data['error']['key'])
+
+    def test_update_meetings_identity_map(self):
+        program = self.create_program(name='프로그램1', description='프로그램1설명입니다.', user=self.user)
+        meetings = [self.create_meeting(name=f'미팅{i}',
+                                        program=program,
+                                        start_time=datetime(2020, 1, 1 + i, 12, 0),
+                                        end_time=datetime(2020, 1, 1 + i, 13, 0)) for i in range(3)]
+
+        gql = """
+        mutation UpdateMeetings($arg:[MeetingUpdateInput]!) {
+            updateMeetings(argument:$arg) {
+                errorIdx
+                meetings {
+                    name
+                    space {
+                        name
+                    }
+                }
+            }
+        }
+        """
+        variables = {
+            'arg': [
+                {
+                    'name': f'meet{i}',
+                    'startTime': f'2020-02-{10 + i}T20:10:00+09:00',
+                    'endTime': f'2020-02-{10 + i}T21:10:00+09:00',
+                    'id': get_global_id_from_object('Meeting', meeting.pk),
+                    'spaceId': get_global_id_from_object('Space', program.space.pk)
+                } for i, meeting in enumerate(meetings)
+            ]
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute(gql, variables, user=self.user)['updateMeetings']
+        self.assertEqual(-1, data['errorIdx'])
+        self.assertEqual(['meet0', 'meet1', 'meet2'], [x['name'] for x in data['meetings']])
+
+        # every row is fetched once for the whole batch
+        selects = [x['sql'] for x in queries if x['sql'].startswith('SELECT')]
+        self.assertEqual(1, len([x for x in selects if x.startswith('SELECT "django_server_space"')]))
+        self.assertEqual(1, len([x for x in selects if x.startswith('SELECT "django_server_meeting"."id", '
+                                                                    '"django_server_meeting"."created_at"')]))
@@ -1,11 +1,19 @@
 import logging
 from datetime import datetime
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_login_failed
 from freezegun import freeze_time
 
 from django_server.const import UserStatusEnum, ManClassEnum, ProgramStateEnum, MannaError
 from django_server.test.test_base import BaseTestCase
 
 from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from django_server.libs.activity import ActivityTracker, activity
+from django_server.libs.hashing import HashingPool
+from django_server.libs.throttle import LocalBucketStore, login_store
 from django_server.models import Profile, ProgramParticipant
 
 
@@ -63,11 +71,22 @@ class UserTestCase(BaseTestCase):
             'password': 'password',
         }
 
+        activity.flush()
         data = self.execute(gql, variables)['signin']
         self.assertNotEqual("", data['token'])
         self.assertEqual(email, data['profile']['email'])
         self.assertEqual(username, data['profile']['name'])
 
+        # the signin time is written behind, in one update for every pending profile
+        profile = Profile.objects.get(user__email=email)
+        self.assertIsNone(profile.last_signin)
+        # one update, in a savepoint of the test's transaction
+        with self.assertNumQueries(3):
+            self.assertEqual(1, activity.flush())
+        profile.refresh_from_db()
+        self.assertEqual(datetime(2020, 4, 1, 12, 0, 0), profile.last_signin)
+        self.assertEqual(datetime(2020, 4, 1, 12, 0, 0), profile.last_seen)
+
         variables = {
             'email': email,
             'password': 'passwo',       # wrong password
@@ -162,3 +181,105 @@ class UserTestCase(BaseTestCase):
 
         ok = self.execute(gql, variables, user=user)['resetPassword']['ok']
         self.assertTrue(ok)
+
+    def test_activity_flush_error(self):
+        profile = self.create_user(username='flush', email='flush@test.ai')
+        tracker = ActivityTracker(interval=0)
+
+        # a failed flush neither raises into the request nor loses the times
+        with mock.patch.object(connection, 'cursor', side_effect=DatabaseError("down")):
+            tracker.signin(profile.id)
+        self.assertIn(profile.id, tracker.pending)
+
+        self.assertEqual(1, tracker.flush())
+        profile.refresh_from_db()
+        self.assertEqual(datetime(2020, 4, 1, 12, 0, 0), profile.last_signin)
+
+    def test_signin_throttle(self):
+        email = 'throttle@test.ai'
+        self.create_user(username='throttle', email=email)
+        login_store.clear()
+
+        gql = """
+        mutation Signin($email:String!, $password:String!) {
+            signin(email:$email, password:$password) {
+                token
+                error {
+                    key
+                }
+            }
+        }
+        """
+
+        with mock.patch('django_server.libs.hashing.check_password', wraps=check_password) as check_mock:
+            for _ in range(5):
+                data = self.execute(gql, {'email': email, 'password': 'wrong'})['signin']
+                self.assertEqual("", data['token'])
+                self.assertIsNone(data['error'])
+
+            # the bucket is empty: rejected without hashing, even with the right password
+            data = self.execute(gql, {'email': email, 'password': 'password'})['signin']
+            self.assertEqual(MannaError.TOO_MANY.name, data['error']['key'])
+        self.assertEqual(5, check_mock.call_count)
+
+        with freeze_time(datetime(2020, 4, 1, 12, 1, 1)):
+            data = self.execute(gql, {'email': email, 'password': 'password'})['signin']
+            self.assertNotEqual("", data['token'])
+
+    def test_signin_busy(self):
+        email = 'busy@test.ai'
+        self.create_user(username='busy', email=email)
+
+        gql = """
+        mutation Signin($email:String!, $password:String!) {
+            signin(email:$email, password:$password) {
+                token
+                error {
+                    key
+                }
+            }
+        }
+        """
+
+        pool = HashingPool(workers=1, queue=0)
+        pool.slots.acquire()
+        with mock.patch('django_server.libs.hashing.hashing_pool', pool):
+            data = self.execute(gql, {'email': email, 'password': 'password'})['signin']
+        self.assertEqual(MannaError.TOO_MANY.name, data['error']['key'])
+
+    def test_signin_authenticate(self):
+        email = 'upgrade@test.ai'
+        profile = self.create_user(username='upgrade', email=email)
+        profile.user.password = make_password('password', hasher='pbkdf2_sha1')
+        profile.user.save()
+        login_store.clear()
+
+        gql = """
+        mutation Signin($email:String!, $password:String!) {
+            signin(email:$email, password:$password) {
+                token
+            }
+        }
+        """
+
+        failed = mock.Mock()
+        user_login_failed.connect(failed)
+        try:
+            data = self.execute(gql, {'email': email, 'password': 'wrong'})['signin']
+        finally:
+            user_login_failed.disconnect(failed)
+        self.assertEqual("", data['token'])
+        self.assertEqual(1, failed.call_count)
+
+        # hashes of an older hasher are upgraded on signin
+        data = self.execute(gql, {'email': email, 'password': 'password'})['signin']
+        self.assertNotEqual("", data['token'])
+        profile.user.refresh_from_db()
+        self.assertTrue(profile.user.password.startswith('pbkdf2_sha256$'))
+
+    def test_local_bucket_store_bounded(self):
+        store = LocalBucketStore(maxsize=2)
+        for email in ['a@test.ai', 'b@test.ai', 'c@test.ai']:
+            self.assertTrue(store.take(email, 1 / 60, 5, 0))
+        self.assertEqual(2, len(store._buckets))
+        self.assertNotIn('a@test.ai', store._buckets)
@@ -19,11 +19,12 @@ from django.views.decorators.csrf import csrf_exempt
 from django_server.libs.authentification import TokenAuthGraphQLView
 
 from django_server import views
+from django_server.graphene.backend import document_backend
 from django_server.schema import schema
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('admin/', admin.site.urls),
     path('test', views.test, name='test'),
-    path(r'graphql/', csrf_exempt(TokenAuthGraphQLView.as_view(graphiql=True, schema=schema)))
+    path(r'graphql/', csrf_exempt(TokenAuthGraphQLView.as_view(graphiql=True, schema=schema, backend=document_backend)))
 ]
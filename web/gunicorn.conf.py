@@ -0,0 +1,62 @@
+# gunicorn settings for bootup.sh, every value can be overridden from the environment
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+
+# prefork workers, each serving requests on a few threads. every thread keeps its own database
+# connection, so workers * threads stays within DB_POOL_SIZE connections for this container.
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+db_pool_size = int(os.environ.get('DB_POOL_SIZE', 20))
+threads = int(os.environ.get('WEB_THREADS', max(1, db_pool_size // workers)))
+worker_class = 'gthread'
+
+# workers are recycled after about this many requests, jittered so they do not restart together
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# a request running longer than this gets its worker killed and replaced
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+# on SIGTERM, workers stop accepting and finish in-flight requests for this long
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# the app is imported and warmed up once in the master, workers share those pages copy-on-write.
+# SIGHUP then only respawns workers from the code already loaded in the master, so a deploy of new
+# code needs a full restart of the container (deploy.py kills and starts it again).
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # buffered activity times and check-ins are written every few seconds, not only by later requests
+    from django_server.libs.activity import activity
+    from django_server.libs.attendance import attendance
+    from django_server.libs.flusher import PeriodicFlusher
+    worker.flusher = PeriodicFlusher([activity, attendance])
+    worker.flusher.start()
+
+
+def worker_exit(server, worker):
+    # and once more before the worker goes away
+    from django_server.libs.activity import activity
+    from django_server.libs.attendance import attendance
+    if getattr(worker, 'flusher', None):
+        worker.flusher.stop()
+    activity.flush()
+    attendance.flush()
+
+
+def when_ready(server):
+    from django_server.libs.preload import preload
+    preload()
+    # objects alive now are never traversed by the collector, so workers do not write to their pages.
+    # no collection may run in between and leave holes in the pages about to be shared.
+    # gc.freeze needs python >= 3.7 (the image's version); without it the pages are not shared
+    if hasattr(gc, 'freeze'):
+        gc.disable()
+        gc.freeze()
+        gc.enable()